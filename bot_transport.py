@@ -0,0 +1,126 @@
+import importlib.util
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict
+
+import httpx
+from telegram.ext import ApplicationBuilder, ContextTypes
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Outbound calls (send_photo, send_message, ...): one reply fans out into several of them
+BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', 32))
+# How long a call may queue for a free connection before it fails with TimedOut
+BOT_API_POOL_TIMEOUT = float(os.getenv('BOT_API_POOL_TIMEOUT', 10))
+BOT_API_CONNECT_TIMEOUT = float(os.getenv('BOT_API_CONNECT_TIMEOUT', 5))
+BOT_API_READ_TIMEOUT = float(os.getenv('BOT_API_READ_TIMEOUT', 10))
+BOT_API_WRITE_TIMEOUT = float(os.getenv('BOT_API_WRITE_TIMEOUT', 10))
+BOT_API_MEDIA_WRITE_TIMEOUT = float(os.getenv('BOT_API_MEDIA_WRITE_TIMEOUT', 30))
+# Idle connections are kept this long, httpx closes them after 5 seconds by default
+BOT_API_KEEPALIVE_EXPIRY = float(os.getenv('BOT_API_KEEPALIVE_EXPIRY', 60))
+# HTTP/2 multiplexes calls over one connection, used when the h2 package is installed
+BOT_API_HTTP2 = os.getenv('BOT_API_HTTP2', '1') == '1' and importlib.util.find_spec('h2') is not None
+BOT_API_METRICS_INTERVAL = int(os.getenv('BOT_API_METRICS_INTERVAL', 600))
+POOL_WAIT_WINDOW = 1000
+
+
+class PoolStats:
+    """Pool wait times and connection reuse of one Bot API connection pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.waits: Deque[float] = deque(maxlen=POOL_WAIT_WINDOW)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self.waits)
+
+        def percentile(fraction: float) -> float:
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "pool": self.name,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "pool_wait_p50_ms": percentile(0.5),
+            "pool_wait_p99_ms": percentile(0.99),
+        }
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Records how long each request waited for a connection.
+
+    httpcore reports no event when a connection is handed out, so the wait is
+    the time until its first trace event: the TCP connect for a new connection,
+    or the request headers going out on a reused one.
+    """
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self.stats
+        stats.requests += 1
+        start = time.perf_counter()
+        waiting = True
+        inner_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal waiting
+            if waiting:
+                waiting = False
+                stats.waits.append(time.perf_counter() - start)
+            if event_name == "connection.connect_tcp.started":
+                stats.new_connections += 1
+            if inner_trace is not None:
+                await inner_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+
+pool_stats: Dict[str, PoolStats] = {}
+
+
+def create_request(name: str, pool_size: int, read_timeout: float, http2: bool = BOT_API_HTTP2) -> HTTPXRequest:
+    """An HTTPXRequest with its own keep-alive pool and pool wait tracking."""
+    stats = pool_stats.setdefault(name, PoolStats(name))
+    transport = InstrumentedTransport(
+        stats,
+        http1=True,
+        http2=http2,
+        # Limits are ignored by httpx when a transport is given, so they go on the transport
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                            keepalive_expiry=BOT_API_KEEPALIVE_EXPIRY),
+    )
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=BOT_API_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        write_timeout=BOT_API_WRITE_TIMEOUT,
+        pool_timeout=BOT_API_POOL_TIMEOUT,
+        media_write_timeout=BOT_API_MEDIA_WRITE_TIMEOUT,
+        http_version="2" if http2 else "1.1",
+        httpx_kwargs={"transport": transport},
+    )
+
+
+def configure_requests(builder: ApplicationBuilder, polling: bool = True) -> ApplicationBuilder:
+    """Give the application separate pools for outbound calls and for getUpdates."""
+    builder = builder.request(create_request("outbound", BOT_API_POOL_SIZE, BOT_API_READ_TIMEOUT))
+    if polling:
+        # A single long poll at a time, run_polling adds its timeout to the read timeout
+        builder = builder.get_updates_request(create_request("polling", 1, BOT_API_READ_TIMEOUT, http2=False))
+    return builder
+
+
+async def log_transport_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback: report pool wait times and connection reuse."""
+    for stats in pool_stats.values():
+        metrics = stats.snapshot()
+        logger.info("Bot API pool metrics: %s", metrics, extra=metrics)
@@ -0,0 +1,38 @@
+import csv
+from pathlib import Path
+from typing import List, NamedTuple
+
+
+class PlantRecord(NamedTuple):
+    persian_name: str
+    scientific_name: str
+    description: str
+
+    def as_plant_info(self) -> dict:
+        """Same shape as a plant in MetisSuggestion.analyze_image results."""
+        return {
+            "scientificName": self.scientific_name,
+            "persianCommonName": self.persian_name,
+            "description": self.description,
+        }
+
+
+def normalize_scientific_name(name: str) -> str:
+    """Canonical key for a scientific name: lower case with single spaces."""
+    return " ".join(name.split()).lower()
+
+
+def load_plant_catalog(csv_path: Path) -> List[PlantRecord]:
+    """Read the plant catalog CSV (Persian Name, Scientific Name, Description)."""
+    records = []
+    with open(csv_path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            scientific_name = (row.get("Scientific Name") or "").strip()
+            if not scientific_name:
+                continue
+            records.append(PlantRecord(
+                persian_name=(row.get("Persian Name") or "").strip(),
+                scientific_name=scientific_name,
+                description=(row.get("Description") or "").strip(),
+            ))
+    return records
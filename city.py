@@ -2,6 +2,8 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 from typing import List
 
+from session_store import sessions
+
 
 # CityNames and CityNotFoundError
 class CityNotFoundError(Exception):
@@ -96,7 +98,7 @@ async def handle_city_selection(update: Update, context: CallbackContext):
         farsi_name = data.split(":")[1]
         try:
             en_name = city_mapper.get_en_name(farsi_name)
-            context.user_data['selected_city'] = en_name
+            sessions.get(update.effective_user.id).set_city(en_name)
             await query.edit_message_text(f"لطفاً یک عکس از فضای مورد نظرتون ارسال کنید.")
         except CityNotFoundError as e:
             await query.edit_message_text(str(e))
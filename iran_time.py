@@ -1,25 +1,91 @@
+import time
 from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
 import pytz
 
+# Jalali month names, index 0 is Farvardin
+JALALI_MONTHS = ("Farvardin", "Ordibehesht", "Khordad", "Tir", "Mordad", "Shahrivar",
+                 "Mehr", "Aban", "Azar", "Dey", "Bahman", "Esfand")
+JALALI_MONTHS_FA = ("فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
+                    "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند")
+# Season of each Jalali month, the Jalali calendar starts every season on a month boundary
+SEASONS = ("spring",) * 3 + ("summer",) * 3 + ("autumn",) * 3 + ("winter",) * 3
+# Coarse day part for each hour of the day
+DAY_PARTS = ("night",) * 5 + ("morning",) * 6 + ("noon",) * 5 + ("evening",) * 4 + ("night",) * 4
+
+_GREGORIAN_DAYS_BEFORE_MONTH = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+def gregorian_to_jalali(gy: int, gm: int, gd: int) -> Tuple[int, int, int]:
+    """Convert a Gregorian date to a Jalali (Solar Hijri) date."""
+    gy2 = gy + 1 if gm > 2 else gy
+    days = (355666 + 365 * gy + (gy2 + 3) // 4 - (gy2 + 99) // 100 + (gy2 + 399) // 400
+            + gd + _GREGORIAN_DAYS_BEFORE_MONTH[gm - 1])
+    jy = -1595 + 33 * (days // 12053)
+    days %= 12053
+    jy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        jy += (days - 1) // 365
+        days = (days - 1) % 365
+    if days < 186:
+        return jy, 1 + days // 31, 1 + days % 31
+    return jy, 7 + (days - 186) // 30, 1 + (days - 186) % 30
+
+
+class TimeContext(NamedTuple):
+    jalali_year: int
+    jalali_month: int
+    jalali_day: int
+    month_name: str
+    month_name_fa: str
+    season: str
+    day_part: str
+
+    @property
+    def jalali_date(self) -> str:
+        return f"{self.jalali_year}/{self.jalali_month:02d}/{self.jalali_day:02d}"
+
+    @property
+    def month_with_season(self) -> str:
+        """Month description used in prompts, e.g. 'Mehr of the Jalali calendar (autumn)'."""
+        return f"{self.month_name} of the Jalali calendar ({self.season})"
+
+
 class IranTime:
     def __init__(self):
         # Set the timezone to Iran Standard Time
         self.timezone = pytz.timezone("Asia/Tehran")
+        self._cached_minute: Optional[int] = None
+        self._cached_context: Optional[TimeContext] = None
 
-    def get_current_month_name(self):
-        # Get the current date and time in Iran's timezone
-        now = datetime.now(self.timezone)
-        # Return the month name
-        return now.strftime("%B")  # Full month name
+    def snapshot(self) -> TimeContext:
+        """Return the current Jalali date and day part in Iran, computed once per minute."""
+        minute = int(time.time()) // 60
+        if minute != self._cached_minute:
+            self._cached_context = self._build_context(datetime.now(self.timezone))
+            self._cached_minute = minute
+        return self._cached_context
 
-    def get_current_hour_am_pm(self):
-        # Get the current date and time in Iran's timezone
-        now = datetime.now(self.timezone)
-        # Return the hour in 12-hour AM/PM format
-        return now.strftime("%I %p")  # Hour (1-12) and AM/PM
+    @staticmethod
+    def _build_context(now: datetime) -> TimeContext:
+        jy, jm, jd = gregorian_to_jalali(now.year, now.month, now.day)
+        return TimeContext(
+            jalali_year=jy,
+            jalali_month=jm,
+            jalali_day=jd,
+            month_name=JALALI_MONTHS[jm - 1],
+            month_name_fa=JALALI_MONTHS_FA[jm - 1],
+            season=SEASONS[jm - 1],
+            day_part=DAY_PARTS[now.hour],
+        )
 
 
 # Example usage
-iran_time = IranTime()
-print("Current month:", iran_time.get_current_month_name())  # Example: November
-print("Current time:", iran_time.get_current_hour_am_pm())   # Example: 02 PM
+if __name__ == "__main__":
+    iran_time = IranTime()
+    time_context = iran_time.snapshot()
+    print("Current Jalali date:", time_context.jalali_date)  # Example: 1403/08/12
+    print("Current month:", time_context.month_name, time_context.season)  # Example: Aban autumn
+    print("Current day part:", time_context.day_part)  # Example: noon
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+from iran_time import DAY_PARTS, IranTime, gregorian_to_jalali
+
+# Nowruz and other well-known dates around the year boundary
+KNOWN_DATES = {
+    (2023, 3, 20): (1401, 12, 29),
+    (2023, 3, 21): (1402, 1, 1),
+    (2024, 3, 19): (1402, 12, 29),
+    (2024, 3, 20): (1403, 1, 1),
+    (2025, 3, 20): (1403, 12, 30),  # 1403 is a leap year
+    (2025, 3, 21): (1404, 1, 1),
+    (2024, 9, 21): (1403, 6, 31),
+    (2024, 9, 22): (1403, 7, 1),
+    (2000, 1, 1): (1378, 10, 11),
+    (1979, 2, 11): (1357, 11, 22),
+}
+
+
+def jalali_month_length(month: int, leap: bool) -> int:
+    if month <= 6:
+        return 31
+    if month <= 11:
+        return 30
+    return 30 if leap else 29
+
+
+def check_known_dates() -> None:
+    for gregorian, jalali in KNOWN_DATES.items():
+        assert gregorian_to_jalali(*gregorian) == jalali, (gregorian, gregorian_to_jalali(*gregorian), jalali)
+
+
+def check_consecutive_days(start: date = date(1990, 1, 1), end: date = date(2040, 12, 31)) -> None:
+    """Every Gregorian day must advance the Jalali date by exactly one day."""
+    previous = gregorian_to_jalali(start.year, start.month, start.day)
+    day = start + timedelta(days=1)
+    while day <= end:
+        current = gregorian_to_jalali(day.year, day.month, day.day)
+        py, pm, pd = previous
+        if current[0] != py:
+            # Esfand 29 or 30 is the last day of a year
+            assert current == (py + 1, 1, 1) and pm == 12 and pd in (29, 30), (day, previous, current)
+        elif current[1] != pm:
+            assert current[1:] == (pm + 1, 1) and pd == jalali_month_length(pm, False), (day, previous, current)
+        else:
+            assert current[2] == pd + 1, (day, previous, current)
+        previous = current
+        day += timedelta(days=1)
+
+
+def check_time_context() -> None:
+    assert len(DAY_PARTS) == 24
+    context = IranTime._build_context(datetime(2024, 3, 20, 8, 30))
+    assert context.jalali_date == "1403/01/01"
+    assert (context.month_name, context.season, context.day_part) == ("Farvardin", "spring", "morning")
+    context = IranTime._build_context(datetime(2025, 3, 20, 23, 0))
+    assert (context.month_name, context.season, context.day_part) == ("Esfand", "winter", "night")
+    assert context.month_with_season == "Esfand of the Jalali calendar (winter)"
+
+
+# Usage: python iran_time.spec.py
+if __name__ == "__main__":
+    check_known_dates()
+    check_consecutive_days()
+    check_time_context()
+    print("iran_time: all checks passed")
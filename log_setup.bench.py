@@ -0,0 +1,62 @@
+import logging
+import statistics
+import tempfile
+import time
+
+from log_setup import setup_logging, stop_logging, new_correlation_id, Truncated
+
+ITERATIONS = 5000
+# Roughly the size of a Metis reply with two plant descriptions
+PAYLOAD = '{"plants": [' + ', '.join(['{"description": "' + 'توضیحات نگهداری ' * 120 + '"}'] * 2) + '], "error": null}'
+
+logger = logging.getLogger("bench")
+
+
+def handler_eager() -> None:
+    """The old style: f-strings built up front and whole payloads logged."""
+    logger.info(f"User selected environment: {'indoor'}")
+    logger.info(f"Uploading file: uploads/AgACAgQAAxkBAAI.jpg")
+    logger.error(f"Invalid JSON response: {PAYLOAD}")
+    logger.info(f"Metis response: {PAYLOAD}")
+    logger.warning(f"{1} of {3} album photos failed to upload")
+
+
+def handler_lazy() -> None:
+    """The new style: %-args formatted on the logging thread, payloads truncated and sampled."""
+    logger.info("User selected environment: %s", 'indoor')
+    logger.info("Uploading file: %s", "uploads/AgACAgQAAxkBAAI.jpg")
+    logger.error("Invalid JSON response: %s", Truncated(PAYLOAD))
+    logger.debug("Metis response: %s", Truncated(PAYLOAD), extra={"sample": True})
+    logger.warning("%d of %d album photos failed to upload", 1, 3)
+
+
+def measure(label: str, handler) -> None:
+    new_correlation_id()
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        handler()
+        timings.append(time.perf_counter() - start)
+    p99 = statistics.quantiles(timings, n=100)[-1]
+    print(f"{label:<34} mean {statistics.mean(timings) * 1e6:8.1f} us  p99 {p99 * 1e6:8.1f} us")
+
+
+# Usage: python log_setup.bench.py
+if __name__ == "__main__":
+    with tempfile.NamedTemporaryFile("w", suffix=".log", encoding="utf-8") as log_file:
+        logging.disable(logging.CRITICAL)
+        measure("logging off", handler_lazy)
+        logging.disable(logging.NOTSET)
+
+        logging.basicConfig(
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            level=logging.INFO,
+            stream=log_file
+        )
+        measure("basicConfig, synchronous writes", handler_eager)
+
+        setup_logging(level="DEBUG", stream=log_file)
+        measure("queue + JSON thread (DEBUG)", handler_lazy)
+        setup_logging(level="INFO", stream=log_file)
+        measure("queue + JSON thread (INFO)", handler_lazy)
+        stop_logging()
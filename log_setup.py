@@ -0,0 +1,163 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Share of records marked as samples (``extra={"sample": True}``) that are kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.05))
+# Longest message written, anything longer is cut
+LOG_MAX_MESSAGE = int(os.getenv('LOG_MAX_MESSAGE', 2000))
+
+# Follows one user request through handlers, tasks and worker threads
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_file_listeners: List[logging.handlers.QueueListener] = []
+
+
+def new_correlation_id() -> str:
+    """Start a new correlation ID for the current task and return it."""
+    value = uuid.uuid4().hex[:12]
+    correlation_id.set(value)
+    return value
+
+
+class Truncated:
+    """Log argument that is only converted to text, and cut, when the record is written."""
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = 500):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text) - self.limit} more chars)"
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the caller before enqueueing: stamps the correlation ID and drops unsampled records."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sample", False) and random.random() >= self.sample_rate:
+            return False
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records as they are; message formatting happens on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "sample", "correlation_id"}
+
+    def __init__(self, static_fields: Optional[Dict[str, Any]] = None, max_message: int = LOG_MAX_MESSAGE):
+        super().__init__()
+        self.static_fields = static_fields or {}
+        self.max_message = max_message
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if len(message) > self.max_message:
+            message = f"{message[:self.max_message]}... ({len(message) - self.max_message} more chars)"
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "message": message,
+            **self.static_fields,
+        }
+        # Anything passed through ``extra=`` becomes a field of its own
+        for key, value in vars(record).items():
+            if key not in self._RESERVED and key not in entry:
+                entry[key] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level: str = LOG_LEVEL, static_fields: Optional[Dict[str, Any]] = None,
+                  stream=None) -> None:
+    """Send every log record through a queue to a background thread writing JSON lines.
+
+    Logging calls on the event loop only put the record on the queue. Can be
+    called again (e.g. in a worker process) to replace the configuration.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(static_fields))
+
+    record_queue = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(record_queue)
+    # The correlation ID lives in the caller's context, so it must be read before enqueueing
+    queue_handler.addFilter(_ContextFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Keep the HTTP client from logging every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(record_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def queued_file_logger(name: str, path: Path) -> logging.Logger:
+    """A logger writing bare messages, one per line, to ``path`` from a background thread.
+
+    It stays out of the main log, e.g. for JSON lines records other tools read.
+    """
+    file_logger = logging.getLogger(name)
+    if file_logger.handlers:
+        return file_logger
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    output = logging.FileHandler(path, encoding="utf-8", delay=True)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    record_queue = queue.SimpleQueue()
+    file_logger.addHandler(_LazyQueueHandler(record_queue))
+    file_logger.setLevel(logging.INFO)
+    file_logger.propagate = False
+
+    listener = logging.handlers.QueueListener(record_queue, output)
+    listener.start()
+    _file_listeners.append(listener)
+    return file_logger
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the background threads."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    while _file_listeners:
+        _file_listeners.pop().stop()
+
+
+atexit.register(stop_logging)
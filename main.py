@@ -1,21 +1,33 @@
+import functools
 import logging
 from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.error import BadRequest
+from telegram.ext import (Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler,
+                          TypeHandler)
 from pathlib import Path
+from typing import List, Tuple
 import os
 from dotenv import load_dotenv
 from model import MetisUploader, MetisSuggestion
 from city import start_city_selection, handle_city_selection, city_mapper
 from iran_time import IranTime
+from plant_media import PlantMediaStore
+from plant_search import PlantIndex
+from media_group import MediaGroupBuffer
+from sharding import run_supervisor
+from log_setup import setup_logging, correlation_id, new_correlation_id, Truncated
+from quality_gate import QualityGate, VERDICT_TOO_SMALL, VERDICT_TOO_DARK, VERDICT_TOO_BLURRY
+from session_store import (sessions, evict_idle_sessions, schedule_pending_photo_expiry, cancel_pending_photo_expiry,
+                           discard_upload, PendingUpload, SESSION_EVICTION_INTERVAL)
+from scheduler import (FairScheduler, build_scheduler, prune_quotas, QuotaExceeded, PRIORITY_FIRST_TIME,
+                       PRIORITY_REPEAT, METIS_MAX_CONCURRENCY)
+from routing import (HedgedRouter, submit_upload, metis_executor, upload_executor, LocalRecommender,
+                     log_routing_metrics, ROUTING_METRICS_INTERVAL, HEDGE_ENABLED)
+from bot_transport import configure_requests, log_transport_metrics, BOT_API_METRICS_INTERVAL
 
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 iran_time = IranTime()
@@ -28,15 +40,38 @@ class Config:
     PUBLIC_DIR: Path = Path('public')
     TEMP_DIR.mkdir(exist_ok=True)  # Ensure temp directory exists
     DEFAULT_IMAGE_PATH = Path('public') / "default.png"
+    PLANT_MEDIA_DIR: Path = PUBLIC_DIR / "plants"
+    PLANTS_CATALOG_PATH: Path = Path('plants_sample.csv')
+    PLANT_INDEX_RELOAD_INTERVAL: int = int(os.getenv('PLANT_INDEX_RELOAD_INTERVAL', 60))
+    # Open the Metis chat session while the user is still answering indoor/outdoor
+    PREWARM_METIS_SESSION: bool = os.getenv('PREWARM_METIS_SESSION', '1') == '1'
+    # More than one worker runs the bot as a supervisor plus worker processes sharded by user_id
+    BOT_WORKERS: int = int(os.getenv('BOT_WORKERS', 1))
 
 
 config = Config()
 
+# Replies for photos rejected by the local quality gate
+QUALITY_GATE_MESSAGES = {
+    VERDICT_TOO_SMALL: "📷 کیفیت عکس خیلی پایینه\n🙏 لطفاً عکس با کیفیت بالاتری ارسال کنید",
+    VERDICT_TOO_DARK: "📷 عکس خیلی تاریکه\n💡 لطفاً در نور بیشتر دوباره عکس بگیرید",
+    VERDICT_TOO_BLURRY: "📷 عکس تار افتاده\n🙏 لطفاً گوشی رو ثابت نگه دارید و دوباره عکس بگیرید",
+}
+
 
 class FlowerBot:
-    def __init__(self):
+    def __init__(self, scheduler: FairScheduler):
         self.recommendation_service = MetisSuggestion()
         self.uploader_service = MetisUploader()
+        self.media_groups = MediaGroupBuffer()
+        self.quality_gate = QualityGate()
+        self.plant_index = PlantIndex(config.PLANTS_CATALOG_PATH)
+        self.local_recommender = LocalRecommender(self.plant_index.records)
+        self.plant_media = PlantMediaStore(config.PLANTS_CATALOG_PATH, config.PLANT_MEDIA_DIR,
+                                           config.DEFAULT_IMAGE_PATH)
+        # Admission control of this process's Metis calls, hedges included
+        self.scheduler = scheduler
+        self.router = HedgedRouter(scheduler=scheduler)
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle the /start command"""
@@ -51,34 +86,122 @@ class FlowerBot:
         """Handle the /city_hange command"""
         await start_city_selection(update, context)
 
+    async def plant_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the /plant command: look a plant up in the local catalog by name"""
+        query = " ".join(context.args or [])
+        if not query:
+            await update.message.reply_text("🔎 نام گیاه رو بعد از دستور بنویسید، مثلاً:\n/plant پتوس")
+            return
+
+        results = self.plant_index.search(query)
+        if not results:
+            await update.message.reply_text("❌ گیاهی با این نام پیدا نشد")
+            return
+
+        await self.send_plant_card(update, context, results[0].as_plant_info(), title="🪴 اطلاعات گیاه:")
+        if len(results) > 1:
+            similar = "\n".join(f"• {record.persian_name} ({record.scientific_name})" for record in results[1:])
+            await update.message.reply_text(f"🔎 نتایج مشابه:\n{similar}")
+
+    async def reload_plant_index(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Job queue callback: pick up edits to the plant catalog CSV."""
+        self.plant_index.reload_if_changed()
+
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle received photos"""
+        # The photo flow keeps one correlation ID until the analysis is sent
+        flow_id = new_correlation_id()
         # Check if the user has selected a city
-        if 'selected_city' not in context.user_data:
+        session = sessions.get(update.effective_user.id)
+        if session.selected_city is None:
             await update.message.reply_text("❌ لطفاً شهرتون انتخاب کنید!")
             await start_city_selection(update, context)
             return
 
+        # Photos of an album arrive as separate updates, only the album's first handler goes on
+        media_group_id = update.message.media_group_id
+        is_first_photo = self.media_groups.join(media_group_id) if media_group_id else True
+        file_path = None
         try:
             # Download the user's photo
             photo = update.message.photo[-1]  # Get the highest resolution photo
             file = await photo.get_file()
-            file_path = config.TEMP_DIR / f"{file.file_id}.jpg"
-            await file.download_to_drive(file_path)
+            download_path = config.TEMP_DIR / f"{file.file_id}.jpg"
+            await file.download_to_drive(download_path)
+
+            # Reject dark, blurry or tiny photos before paying for an upload and an LLM call
+            gate_result = await self.quality_gate.check(download_path)
+            if gate_result is not None and not gate_result.accepted:
+                download_path.unlink(missing_ok=True)
+                await update.message.reply_text(QUALITY_GATE_MESSAGES[gate_result.verdict])
+            else:
+                file_path = download_path
+        except Exception as e:
+            logger.error("Error in handle_photo: %s", e)
+            await update.message.reply_text(
+                "❌ متأسفانه خطایی رخ داده\n"
+                "🙏 لطفاً دوباره تلاش کنید"
+            )
+        finally:
+            if media_group_id:
+                self.media_groups.add(media_group_id, file_path)
 
-            # Store the file path temporarily in user data
-            context.user_data['uploaded_file_path'] = file_path
+        if media_group_id:
+            if not is_first_photo:
+                return
+            file_paths = await self.media_groups.collect(media_group_id)
+        else:
+            file_paths = [file_path] if file_path else []
+        if not file_paths:
+            return
+
+        # Over-quota users would be refused at analysis time, don't upload or open a session for them
+        retry_after = self.scheduler.quota_retry_after(update.effective_user.id)
+        if retry_after:
+            logger.info("Rejected photo of user %s over quota", update.effective_user.id)
+            discard_upload(file_paths, None)
+            await self.send_quota_message(update, context, retry_after)
+            return
+
+        try:
+            # Start uploading right away so it overlaps with the user's indoor/outdoor choice.
+            # A newer photo replaces an unanswered one.
+            session.discard_uploaded_files(self.release_analysis)
+            pending_upload = self.start_upload(file_paths)
+            session.set_uploaded_files(file_paths, pending_upload)
+            session.correlation_id = flow_id
+            schedule_pending_photo_expiry(context, update.effective_user.id, self.release_analysis)
 
             # Prompt user for indoor/outdoor selection
             await self.ask_environment_choice(update, context)
 
         except Exception as e:
-            logger.error(f"Error in handle_photo: {e}")
+            logger.error("Error in handle_photo: %s", e)
             await update.message.reply_text(
                 "❌ متأسفانه خطایی رخ داده\n"
                 "🙏 لطفاً دوباره تلاش کنید"
             )
 
+    def start_upload(self, file_paths: List[Path]) -> PendingUpload:
+        """Start uploading the photos to Metis storage in parallel and, if enabled, opening a chat session alongside.
+
+        They run on the upload threads, so they never hold up analyses that
+        already got their scheduler slot.
+        """
+        return PendingUpload(
+            [submit_upload(self.uploader_service.upload_file, str(file_path)) for file_path in file_paths],
+            submit_upload(self.recommendation_service.create_session) if config.PREWARM_METIS_SESSION else None)
+
+    def release_analysis(self, prepared: Tuple[List[str], str]) -> None:
+        """Close the Metis session prewarmed for photos that will not be analyzed.
+
+        The photos already uploaded to Metis storage are left there, there is
+        no call to delete them.
+        """
+        _, session_id = prepared
+        if session_id:
+            submit_upload(self.recommendation_service.delete_session, session_id)
+
     async def ask_environment_choice(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Prompt the user to choose between indoor and outdoor."""
         question = "فضای مد نظرتون رو انتخاب کنید:"
@@ -96,10 +219,13 @@ class FlowerBot:
 
         # Extract the choice
         choice = query.data.split(":")[1]  # "outdoor" or "indoor"
-        context.user_data['environment'] = choice
+        session = sessions.get(update.effective_user.id)
+        session.set_environment(choice)
+        if session.correlation_id:
+            correlation_id.set(session.correlation_id)
 
         # Log the user's choice
-        logger.info(f"User selected environment: {choice}")
+        logger.info("User selected environment: %s", choice)
 
         # Confirm the choice
         await query.edit_message_text(
@@ -111,118 +237,235 @@ class FlowerBot:
 
     async def analyze_uploaded_image(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Analyze the uploaded image based on user inputs."""
+        file_paths = []
+        pending_upload = None
+        waiting_message = None
+        analyzed = False
         try:
-            file_path = context.user_data.get('uploaded_file_path')
-            environment = context.user_data.get('environment')
-            selected_city = context.user_data.get('selected_city')
+            session = sessions.get(update.effective_user.id)
+            file_paths, pending_upload = session.pop_uploaded_files()
+            cancel_pending_photo_expiry(context, update.effective_user.id)
+            environment = session.environment
+            selected_city = session.selected_city
 
-            if not file_path or not environment:
+            if not file_paths or not environment:
                 raise ValueError("Missing file or environment information.")
 
-            # Upload the file
-            uploaded_path = self.uploader_service.upload_file(str(file_path))
+            # The upload usually finished while the user was choosing
+            if pending_upload is None:
+                pending_upload = self.start_upload(file_paths)
+            uploaded_paths, metis_session_id = await pending_upload.result()
 
-            if not uploaded_path:
+            if not uploaded_paths:
                 await context.bot.send_message(chat_id=update.effective_chat.id,
                                                text="❌ متأسفانه در آپلود تصویر مشکلی پیش آمده\n🙏 لطفاً دوباره تلاش کنید")
                 return
 
-            # Notify the user and proceed with image analysis
-            selected_city = context.user_data['selected_city']
-            waiting_message = await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"شهر انتخابی شما: {city_mapper.get_farsi_name(selected_city)}\n⏳ در حال پردازش تصویر شما..."
-            )
-            # Use the API to analyze the image and get plant info
-            plants_info = self.recommendation_service.analyze_image(uploaded_path, selected_city,
-                                                                    iran_time.get_current_hour_am_pm(),
-                                                                    iran_time.get_current_month_name(), environment)
+            # First-time users are served ahead of repeat senders
+            priority = PRIORITY_FIRST_TIME if session.analysis_count == 0 else PRIORITY_REPEAT
+            async with self.scheduler.slot(update.effective_chat.id, update.effective_user.id, priority):
+                # Notify the user and proceed with image analysis
+                waiting_message = await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=f"شهر انتخابی شما: {city_mapper.get_farsi_name(selected_city)}\n⏳ در حال پردازش تصویر شما..."
+                )
+                # Use the API to analyze the image and get plant info, hedged against a slow Metis
+                time_context = iran_time.snapshot()
+                analyzed = True
+                analyze = functools.partial(self.recommendation_service.analyze_image, uploaded_paths,
+                                            selected_city, time_context.day_part,
+                                            time_context.month_with_season, environment)
+                plants_info = await self.router.route(
+                    primary=functools.partial(analyze, metis_session_id),
+                    hedge=analyze,  # A fresh Metis session, the prewarmed one is busy with the primary
+                    fallback=functools.partial(self.local_recommender.recommend, environment, selected_city,
+                                               time_context.season)
+                )
+                session.analysis_count += 1
+
             await context.bot.delete_message(
                 chat_id=update.effective_chat.id,
                 message_id=waiting_message.message_id
             )
+            waiting_message = None
 
             if plants_info['error'] is not None:
-                await context.bot.delete_message(
-                    chat_id=update.effective_chat.id,
-                    message_id=waiting_message.message_id
-                )
                 raise Exception(plants_info['error'])
 
-            # Prepare the caption for the default image
-            for item in plants_info['plants']:
-                response_message = (
-                    f"🪴 اطلاعات گیاه پیشنهادی:\n"
-                    f"📚 نام علمی: {item['scientificName']}\n"
-                    f"🌿 نام فارسی: {item['persianCommonName']}\n"
-                    f"📝 توضیحات: {item['description']}"
+            if plants_info.get('fallback'):
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text="⚡ پاسخ سرویس تحلیل تصویر طول کشید، این پیشنهادها از فهرست گیاهان ربات است:"
                 )
 
-                # Send the default image with the plant info as the caption
-                if config.DEFAULT_IMAGE_PATH.exists():
-                    with config.DEFAULT_IMAGE_PATH.open("rb") as image_file:  # Open the file in binary mode
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=InputFile(image_file),
-                            caption=response_message
-                        )
-                else:
-                    await context.bot.send_message(
-                        chat_id=update.effective_chat.id, text=response_message)
+            # Send each plant with its own image (or the default one) as the caption holder
+            for item in plants_info['plants']:
+                await self.send_plant_card(update, context, item)
 
+        except QuotaExceeded as e:
+            logger.info("Rejected analysis: %s", e)
+            await self.send_quota_message(update, context, e.retry_after)
         except Exception as e:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id,
-                message_id=waiting_message.message_id
-            )
-            logger.error(f"Error in handle_photo: {e}")
+            if waiting_message is not None:
+                await context.bot.delete_message(
+                    chat_id=update.effective_chat.id,
+                    message_id=waiting_message.message_id
+                )
+            logger.error("Error in analyze_uploaded_image: %s", e)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id, text="❌ متأسفانه خطایی رخ داده\n"
                                                        "🙏 لطفاً دوباره تلاش کنید"
             )
         finally:
-            # Clean up the temporary file
-            if 'file_path' in locals():
-                file_path.unlink(missing_ok=True)
+            # Clean up the temporary files, and the Metis session if the analysis never got to use it
+            discard_upload(file_paths, pending_upload, None if analyzed else self.release_analysis)
 
             # Ensure that the bot is ready for the next interaction (commands or messages)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id, text="🛠️ آماده دریافت دستور جدید.")
 
+    async def send_quota_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                 retry_after: float) -> None:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"⏳ تعداد درخواست‌های شما زیاد بوده\n🙏 لطفاً {int(retry_after // 60) + 1} دقیقه دیگر دوباره تلاش کنید"
+        )
+
+    async def startup(self, application: Application) -> None:
+        """Start worker processes before the first update arrives."""
+        self.quality_gate.start()
+
+    async def shutdown(self, application: Application) -> None:
+        """Release worker processes and Metis threads when the bot stops."""
+        self.quality_gate.shutdown()
+        # Requests still running end at their timeout, queued ones are dropped
+        metis_executor.shutdown(wait=False, cancel_futures=True)
+        upload_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def send_plant_card(self, update: Update, context: ContextTypes.DEFAULT_TYPE, item: dict,
+                              title: str = "🪴 اطلاعات گیاه پیشنهادی:") -> None:
+        """Send a plant's info as the caption of its image."""
+        response_message = (
+            f"{title}\n"
+            f"📚 نام علمی: {item['scientificName']}\n"
+            f"🌿 نام فارسی: {item['persianCommonName']}\n"
+            f"📝 توضیحات: {item['description']}"
+        )
+
+        media = self.plant_media.lookup(item['scientificName'])
+        if media.file_id:
+            # Already uploaded once, let Telegram reuse it
+            try:
+                await context.bot.send_photo(
+                    chat_id=update.effective_chat.id,
+                    photo=media.file_id,
+                    caption=response_message
+                )
+                return
+            except BadRequest as e:
+                # Stale file_id (new bot token, media removed on Telegram's side): upload the file again
+                logger.warning("Cached file_id for %s rejected: %s", media.path, e)
+                self.plant_media.forget_file_id(media)
+
+        if media.path:
+            with media.path.open("rb") as image_file:  # Open the file in binary mode
+                message = await context.bot.send_photo(
+                    chat_id=update.effective_chat.id,
+                    photo=InputFile(image_file),
+                    caption=response_message
+                )
+            self.plant_media.remember_file_id(media, message.photo[-1].file_id)
+        else:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, text=response_message)
+
+
+async def assign_correlation_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Tag every log record of this update, photo flows replace it with their own ID."""
+    correlation_id.set(f"update-{update.update_id}")
+
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle errors in the bot"""
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", Truncated(update), context.error)
     try:
         await update.message.reply_text(
             "❌ متأسفانه خطایی رخ داده\n"
             "🙏 لطفاً دوباره تلاش کنید"
         )
     except Exception as e:
-        logger.error(f"Error sending error message: {e}")
+        logger.error("Error sending error message: %s", e)
+
+
+def build_application(with_updater: bool = True) -> Application:
+    """Create the bot application with all handlers and jobs registered."""
+    # A sharded worker has its own scheduler, so it gets a share of the global Metis limit.
+    # User quotas need no split, a user's updates always go to the same worker.
+    workers = 1 if with_updater else config.BOT_WORKERS
+    if METIS_MAX_CONCURRENCY < workers:
+        logger.warning("METIS_MAX_CONCURRENCY=%d is below BOT_WORKERS=%d, allowing one Metis call per worker",
+                       METIS_MAX_CONCURRENCY, workers)
+    scheduler = build_scheduler(max(1, METIS_MAX_CONCURRENCY // workers))
+    if HEDGE_ENABLED and scheduler.max_concurrency < 2:
+        # A hedge needs a slot besides the one its caller holds
+        logger.warning("Hedged Metis requests never fire with a single Metis slot, "
+                       "set METIS_MAX_CONCURRENCY to at least %d to use them", 2 * workers)
+    bot = FlowerBot(scheduler)
+    builder = (Application.builder()
+               .token(config.TELEGRAM_TOKEN)
+               .concurrent_updates(True)  # Metis calls are queued by the fair scheduler instead
+               .post_init(bot.startup)
+               .post_shutdown(bot.shutdown))
+    builder = configure_requests(builder, polling=with_updater)
+    if not with_updater:
+        # Sharded worker: updates are fed by the supervisor process
+        builder = builder.updater(None)
+    app = builder.build()
+
+    # Add handlers
+    app.add_handler(TypeHandler(Update, assign_correlation_id), group=-1)
+    app.add_handler(CommandHandler("start", bot.start_command))
+    app.add_handler(CommandHandler("city", bot.city_change_command))
+    app.add_handler(CommandHandler("plant", bot.plant_command))
+    app.add_handler(CallbackQueryHandler(handle_city_selection, pattern="^(city_page:|select_city:)"))
+    app.add_handler(MessageHandler(filters.PHOTO, bot.handle_photo))
+    app.add_handler(CallbackQueryHandler(bot.handle_environment_choice, pattern="^environment:"))
+    app.add_error_handler(error_handler)
+
+    # Periodically drop sessions of users who went idle
+    app.job_queue.run_repeating(evict_idle_sessions, interval=SESSION_EVICTION_INTERVAL,
+                                first=SESSION_EVICTION_INTERVAL, data=bot.release_analysis)
+    app.job_queue.run_repeating(prune_quotas, interval=SESSION_EVICTION_INTERVAL,
+                                first=SESSION_EVICTION_INTERVAL, data=scheduler)
+    app.job_queue.run_repeating(bot.reload_plant_index, interval=config.PLANT_INDEX_RELOAD_INTERVAL,
+                                first=config.PLANT_INDEX_RELOAD_INTERVAL)
+    app.job_queue.run_repeating(log_routing_metrics, interval=ROUTING_METRICS_INTERVAL,
+                                first=ROUTING_METRICS_INTERVAL, data=bot.router)
+    app.job_queue.run_repeating(log_transport_metrics, interval=BOT_API_METRICS_INTERVAL,
+                                first=BOT_API_METRICS_INTERVAL)
+    return app
+
+
+def build_worker_application() -> Application:
+    return build_application(with_updater=False)
 
 
 def main() -> None:
     """Main function to run the bot"""
+    setup_logging()
     try:
-        # Initialize the bot
-        bot = FlowerBot()
-        app = (Application.builder()
-               .token(config.TELEGRAM_TOKEN)
-               .build())
+        if config.BOT_WORKERS > 1:
+            # Supervisor mode: this process polls, workers sharded by user_id do the rest
+            run_supervisor(config.TELEGRAM_TOKEN, config.BOT_WORKERS, build_worker_application)
+            return
 
-        # Add handlers
-        app.add_handler(CommandHandler("start", bot.start_command))
-        app.add_handler(CommandHandler("city", bot.city_change_command))
-        app.add_handler(CallbackQueryHandler(handle_city_selection, pattern="^(city_page:|select_city:)"))
-        app.add_handler(MessageHandler(filters.PHOTO, bot.handle_photo))
-        app.add_handler(CallbackQueryHandler(bot.handle_environment_choice, pattern="^environment:"))
-        app.add_error_handler(error_handler)
+        # Initialize the bot
+        app = build_application()
 
         # Start the bot
         app.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
-        logger.critical(f"Critical error starting bot: {e}")
+        logger.critical("Critical error starting bot: %s", e)
         print(f"Critical error starting bot: {e}")
 
 
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the rest of an album after its first photo arrives
+MEDIA_GROUP_WINDOW = float(os.getenv('MEDIA_GROUP_WINDOW', 1.5))
+# Upper bound on waiting for album photos that are still downloading
+MEDIA_GROUP_DOWNLOAD_TIMEOUT = float(os.getenv('MEDIA_GROUP_DOWNLOAD_TIMEOUT', 30))
+# Collected albums are remembered this long so their late photos are dropped, not taken for a new album
+MEDIA_GROUP_TOMBSTONE_TTL = float(os.getenv('MEDIA_GROUP_TOMBSTONE_TTL', 120))
+
+
+class _Album:
+    __slots__ = ("file_paths", "downloading", "downloaded")
+
+    def __init__(self):
+        self.file_paths: List[Path] = []
+        self.downloading = 0
+        self.downloaded = asyncio.Event()
+
+
+class MediaGroupBuffer:
+    """Collects the photos of a Telegram album (messages sharing a ``media_group_id``).
+
+    Telegram delivers every album photo as its own update. The first photo's
+    handler calls ``collect`` and gets all of them; the others only ``add``
+    their downloaded file and return.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW, download_timeout: float = MEDIA_GROUP_DOWNLOAD_TIMEOUT,
+                 tombstone_ttl: float = MEDIA_GROUP_TOMBSTONE_TTL):
+        self.window = window
+        self.download_timeout = download_timeout
+        self.tombstone_ttl = tombstone_ttl
+        self._albums: Dict[str, _Album] = {}
+        # media_group_id -> when it was collected, oldest first
+        self._collected: "OrderedDict[str, float]" = OrderedDict()
+
+    def join(self, media_group_id: str) -> bool:
+        """Announce a photo that is about to be downloaded. Returns True for the album's first photo.
+
+        Returns False for a photo of an album that was already collected, its
+        ``add`` then drops it.
+        """
+        self._expire_tombstones()
+        if media_group_id in self._collected:
+            return False
+        album = self._albums.get(media_group_id)
+        is_first = album is None
+        if is_first:
+            album = self._albums[media_group_id] = _Album()
+        album.downloading += 1
+        album.downloaded.clear()
+        return is_first
+
+    def add(self, media_group_id: str, file_path: Optional[Path]) -> None:
+        """Hand over a downloaded photo, or None if its download failed."""
+        album = self._albums.get(media_group_id)
+        if album is None:
+            # The album was already collected, this photo arrived too late
+            if file_path:
+                logger.warning("Photo for album %s arrived after the window, dropping it", media_group_id)
+                file_path.unlink(missing_ok=True)
+            return
+        if file_path:
+            album.file_paths.append(file_path)
+        album.downloading -= 1
+        if album.downloading == 0:
+            album.downloaded.set()
+
+    async def collect(self, media_group_id: str) -> List[Path]:
+        """Wait for the album window to close and return all of its photos."""
+        album = self._albums[media_group_id]
+        try:
+            await asyncio.sleep(self.window)
+            if album.downloading:
+                try:
+                    await asyncio.wait_for(album.downloaded.wait(), self.download_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning("Album %s still has %d photos downloading, continuing without them",
+                                   media_group_id, album.downloading)
+            return album.file_paths
+        finally:
+            del self._albums[media_group_id]
+            self._collected[media_group_id] = time.monotonic()
+
+    def _expire_tombstones(self) -> None:
+        deadline = time.monotonic() - self.tombstone_ttl
+        while self._collected and next(iter(self._collected.values())) < deadline:
+            self._collected.popitem(last=False)
@@ -0,0 +1,80 @@
+import asyncio
+import tempfile
+from pathlib import Path
+
+from media_group import MediaGroupBuffer
+
+
+def make_photo(directory: Path, name: str) -> Path:
+    path = directory / f"{name}.jpg"
+    path.write_bytes(b"jpeg")
+    return path
+
+
+async def photo_handler(buffer: MediaGroupBuffer, directory: Path, album: str, name: str, download_time: float):
+    """What FlowerBot.handle_photo does with an album photo: join, download, add, and collect if first."""
+    is_first = buffer.join(album)
+    await asyncio.sleep(download_time)
+    buffer.add(album, make_photo(directory, name) if download_time >= 0 else None)
+    if is_first:
+        return await buffer.collect(album)
+    return None
+
+
+async def check_album_is_collected_once(directory: Path) -> None:
+    buffer = MediaGroupBuffer(window=0.05, download_timeout=1)
+    results = await asyncio.gather(
+        photo_handler(buffer, directory, "album", "a1", 0.0),
+        photo_handler(buffer, directory, "album", "a2", 0.01),
+        # Still downloading when the window closes, collect waits for it
+        photo_handler(buffer, directory, "album", "a3", 0.2),
+    )
+    collected, *others = results
+    assert sorted(path.name for path in collected) == ["a1.jpg", "a2.jpg", "a3.jpg"], collected
+    assert others == [None, None]
+
+
+async def check_failed_download(directory: Path) -> None:
+    buffer = MediaGroupBuffer(window=0.05, download_timeout=1)
+    collected, _ = await asyncio.gather(
+        photo_handler(buffer, directory, "broken", "b1", 0.0),
+        photo_handler(buffer, directory, "broken", "b2", -1),  # download failed, adds None
+    )
+    assert [path.name for path in collected] == ["b1.jpg"]
+
+
+async def check_late_photo_is_dropped(directory: Path) -> None:
+    buffer = MediaGroupBuffer(window=0.01, download_timeout=1, tombstone_ttl=60)
+    collected = await photo_handler(buffer, directory, "late", "l1", 0.0)
+    assert [path.name for path in collected] == ["l1.jpg"]
+
+    # A photo of the same album arriving after collect must not start a second album
+    assert buffer.join("late") is False
+    late_photo = make_photo(directory, "l2")
+    buffer.add("late", late_photo)
+    assert not late_photo.exists()
+    assert "late" not in buffer._albums
+
+
+async def check_tombstones_expire(directory: Path) -> None:
+    buffer = MediaGroupBuffer(window=0.01, download_timeout=1, tombstone_ttl=0.05)
+    await photo_handler(buffer, directory, "old", "o1", 0.0)
+    assert buffer.join("other") is True
+    await asyncio.sleep(0.1)
+    buffer.join("another")
+    assert "old" not in buffer._collected
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        await check_album_is_collected_once(directory)
+        await check_failed_download(directory)
+        await check_late_photo_is_dropped(directory)
+        await check_tombstones_expire(directory)
+
+
+# Usage: python media_group.spec.py
+if __name__ == "__main__":
+    asyncio.run(main())
+    print("media_group: all checks passed")
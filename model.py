@@ -3,23 +3,28 @@ import os
 import requests
 from dotenv import load_dotenv
 import logging
+from typing import List
 
 from iran_time import IranTime
+from log_setup import setup_logging, Truncated
 
 iran_time = IranTime()
 
 load_dotenv()
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # Proxy settings for Iranian networks
 PROXY = {
     "http": os.getenv('HTTP_IR_PROXY'),
 }
+# Analysis error for photos showing no space a plant could go in
+BAD_IMAGE_ERROR = "Please provide clearer images of your space."
+# Total time a user waits for an analysis before getting the local catalog answer instead
+LATENCY_BUDGET = float(os.getenv('LATENCY_BUDGET', 45))
+# (connect, read) timeouts of every Metis request, so a stalled call frees its thread.
+# The read timeout bounds each wait for data, neither may outlast the latency budget.
+METIS_TIMEOUT = (min(float(os.getenv('METIS_CONNECT_TIMEOUT', 5)), LATENCY_BUDGET),
+                 min(float(os.getenv('METIS_READ_TIMEOUT', LATENCY_BUDGET)), LATENCY_BUDGET))
 
 
 class MetisUploader:
@@ -33,7 +38,7 @@ class MetisUploader:
     def upload_file(self, file_path: str) -> str:
         """Uploads a file to Metis storage and returns the file URL if successful."""
         if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
+            logger.error("File not found: %s", file_path)
             return ""
 
         try:
@@ -46,7 +51,7 @@ class MetisUploader:
                 }
 
                 response = requests.post(self.storage_endpoint, headers=headers, files=files, proxies=PROXY,
-                                         verify=False)
+                                         verify=False, timeout=METIS_TIMEOUT)
 
                 if response.status_code == 200:
                     response_data = response.json()
@@ -57,11 +62,12 @@ class MetisUploader:
                         logger.error("Upload response did not contain a file URL.")
                         return ""
                 else:
-                    logger.error(f"Failed to upload file. Status: {response.status_code}, Response: {response.text}")
+                    logger.error("Failed to upload file. Status: %s, Response: %s", response.status_code,
+                                 Truncated(response.text))
                     return ""
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"Request exception during file upload: {e}")
+            logger.error("Request exception during file upload: %s", e)
             return ""
 
 
@@ -76,10 +82,46 @@ class MetisSuggestion:
         if not self.metis_bot_id:
             logger.error("Metis Bot ID is missing. Please check your .env file.")
             raise ValueError("Metis Bot ID is missing.")
+        self.headers = {
+            "Authorization": f"Bearer {self.metis_api_key}",
+            "Content-Type": "application/json"
+        }
 
-    def analyze_image(self, image_url: str, selected_city: str, hour: str, month: str, environment: str):
+    def create_session(self) -> str:
+        """Open a Metis chat session and return its ID, or an empty string on failure."""
+        session_data = {
+            "botId": self.metis_bot_id,
+            "user": None,
+        }
+        try:
+            session_response = requests.post(self.wrapper_endpoint, headers=self.headers, json=session_data,
+                                             proxies=PROXY, verify=False, timeout=METIS_TIMEOUT)
+            session_response.raise_for_status()
+            session_id = session_response.json()['id']
+            if not session_id:
+                logger.error("Session ID not returned in response.")
+                return ""
+            return session_id
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.error("Unable to initiate Metis session: %s", e)
+            return ""
+
+    def delete_session(self, session_id: str) -> bool:
+        """Close a Metis chat session that will not be used."""
+        try:
+            response = requests.delete(f"{self.wrapper_endpoint}/{session_id}", headers=self.headers,
+                                       proxies=PROXY, verify=False, timeout=METIS_TIMEOUT)
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error("Unable to close Metis session %s: %s", session_id, e)
+            return False
+
+    def analyze_image(self, image_urls: List[str], selected_city: str, day_part: str, month: str, environment: str,
+                      session_id: str = ""):
+        subject = "provided image's" if len(image_urls) == 1 else f"{len(image_urls)} provided images (all of the same space)"
         prompt = (
-            f"According to the provided image's captured in {hour} in {selected_city},Iran\n"
+            f"According to the {subject} captured in the {day_part} in {selected_city},Iran\n"
             f"recommend two {environment} plants based on these criteria:\n"
             f"0. Keep in mind this picture is taken in {month} so suggested plant should be according to season\n"
             f"1. Plants should be suitable for {environment} and compatible with {selected_city}'s climate and regional biomes.\n"
@@ -101,25 +143,15 @@ class MetisSuggestion:
             "   - *critical note:* response is invalid if it is wrapped in ```{any language}```, and some thing like ```json``` should not be used in response"
 
         )
-        """Send the image URL to Metis API for plant analysis and get recommendations."""
-
-        session_data = {
-            "botId": self.metis_bot_id,
-            "user": None,
-        }
-        headers = {
-            "Authorization": f"Bearer {self.metis_api_key}",
-            "Content-Type": "application/json"
-        }
+        """Send the image URLs to Metis API for plant analysis and get recommendations.
 
+        Several URLs (an album of the same space) go out as attachments of a single message.
+        ``session_id`` may be a session opened ahead of time with ``create_session``.
+        """
         try:
-            # Initiate session
-            session_response = requests.post(self.wrapper_endpoint, headers=headers, json=session_data, proxies=PROXY,
-                                             verify=False)
-            session_response.raise_for_status()
-            session_id = session_response.json()['id']
+            # Initiate session unless one was prepared already
+            session_id = session_id or self.create_session()
             if not session_id:
-                logger.error("Session ID not returned in response.")
                 return {"error": "Unable to initiate Metis session.", "plants": []}
 
             data = {
@@ -131,50 +163,54 @@ class MetisSuggestion:
                             "content": image_url,
                             "contentType": "IMAGE"
                         }
+                        for image_url in image_urls
                     ]
                 }
             }
 
             response = requests.post(
                 f'https://api.metisai.ir/api/v1/chat/session/{session_id}/message',
-                headers=headers, json=data, proxies=PROXY, verify=False
+                headers=self.headers, json=data, proxies=PROXY, verify=False, timeout=METIS_TIMEOUT
             )
             response.raise_for_status()
 
             response_data = response.json()
+            logger.debug("Metis response: %s", Truncated(response_data.get('content')), extra={"sample": True})
 
             try:
                 # Try to parse the content as JSON
                 plant_object = json.loads(response_data['content'])
             except (json.JSONDecodeError, TypeError):
-                logger.error(f"Invalid JSON response: {response_data['content']}")
+                logger.error("Invalid JSON response: %s", Truncated(response_data['content']))
                 return {"error": "Invalid response format", "plants": []}
 
             # Validate response format
             if isinstance(plant_object, dict):
                 if "error" in plant_object and plant_object["error"] == "badImage":
-                    return {"error": "Please provide clearer images of your space.", "plants": []}
+                    return {"error": BAD_IMAGE_ERROR, "plants": []}
                 elif "plants" in plant_object:
                     return {"plants": plant_object["plants"], "error": None}
 
             return {"error": "Invalid response format", "plants": []}
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed: {e}")
+            logger.error("Request failed: %s", e)
             return {"error": "Unable to retrieve plant recommendations at this time.", "plants": []}
         except Exception as e:
-            logger.error(f"Error processing image with Metis API: {e}")
+            logger.error("Error processing image with Metis API: %s", e)
             return {"error": "An unexpected error occurred during processing.", "plants": []}
 
 
 # Usage
 if __name__ == "__main__":
+    setup_logging()
     uploader = MetisUploader()
     image_url = uploader.upload_file('uploads/photo_5846132522528916670_y.jpg')
     if image_url:
         suggestion = MetisSuggestion()
-        res = suggestion.analyze_image(image_url, 'Tehran', iran_time.get_current_hour_am_pm(),
-                                       iran_time.get_current_month_name(), environment='indoor')
+        time_context = iran_time.snapshot()
+        res = suggestion.analyze_image([image_url], 'Tehran', time_context.day_part,
+                                       time_context.month_with_season, environment='indoor')
         print(res)
     else:
         print("Image upload failed.")
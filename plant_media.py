@@ -0,0 +1,184 @@
+import argparse
+import json
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from catalog import load_plant_catalog, normalize_scientific_name
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEY = "__default__"
+THUMBNAIL_MAX_SIZE = 512
+THUMBNAIL_QUALITY = 80
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tiff')
+
+
+class PlantMedia(NamedTuple):
+    key: str
+    path: Optional[Path]
+    file_id: Optional[str]
+
+
+def thumbnail_slug(scientific_name: str) -> str:
+    """File name stem used for a plant's thumbnail, e.g. 'ficus_benjamina'."""
+    key = normalize_scientific_name(scientific_name)
+    return re.sub(r"[^a-z0-9]+", "_", key).strip("_")
+
+
+class PlantMediaStore:
+    """Local plant image library keyed by scientific name.
+
+    Thumbnails are produced offline by ``build_thumbnails`` and only looked up
+    here. Once Telegram has seen a thumbnail, its ``file_id`` is cached on disk
+    so later replies reference the already uploaded photo instead of re-sending
+    the bytes.
+    """
+
+    def __init__(self, catalog_path: Path, media_dir: Path, default_image_path: Path):
+        self.media_dir = media_dir
+        self.file_id_cache_path = media_dir / "file_ids.json"
+        self.default_image_path = default_image_path if default_image_path.exists() else None
+        self._thumbnails: Dict[str, Path] = {}
+        self._file_ids: Dict[str, str] = self._load_file_ids()
+        # What this process changed, merged into the disk cache that other workers write too
+        self._remembered: Dict[str, str] = {}
+        self._forgotten: Dict[str, str] = {}
+
+        try:
+            catalog = load_plant_catalog(catalog_path)
+        except OSError as e:
+            logger.error("Unable to read plant catalog %s: %s", catalog_path, e)
+            catalog = []
+
+        for record in catalog:
+            thumbnail_path = media_dir / f"{thumbnail_slug(record.scientific_name)}.jpg"
+            if thumbnail_path.exists():
+                self._register(normalize_scientific_name(record.scientific_name), thumbnail_path)
+        logger.info("Loaded %d plant thumbnails from %s", len(self._thumbnails), media_dir)
+
+    def _register(self, key: str, path: Path) -> None:
+        self._thumbnails[key] = path
+        # Also index by binomial (genus + species) so cultivar names still match
+        binomial = " ".join(key.split()[:2])
+        self._thumbnails.setdefault(binomial, path)
+
+    def _load_file_ids(self) -> Dict[str, str]:
+        try:
+            with self.file_id_cache_path.open(encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable file_id cache %s: %s", self.file_id_cache_path, e)
+            return {}
+
+    def _save_file_ids(self) -> None:
+        """Merge our file_ids into the cache on disk, which other worker processes write too."""
+        file_ids = {path: file_id for path, file_id in self._load_file_ids().items()
+                    if self._forgotten.get(path) != file_id}
+        file_ids.update(self._remembered)
+        self._file_ids = file_ids
+        tmp_path = None
+        try:
+            self.media_dir.mkdir(parents=True, exist_ok=True)
+            # A temp file of our own, so concurrent writers never interleave
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.media_dir, prefix="file_ids.",
+                                             suffix=".tmp", delete=False) as cache_file:
+                tmp_path = cache_file.name
+                json.dump(file_ids, cache_file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_id_cache_path)
+        except OSError as e:
+            logger.error("Unable to persist file_id cache: %s", e)
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+
+    def lookup(self, scientific_name: str) -> PlantMedia:
+        """Return the image for a plant, falling back to the default image."""
+        key = normalize_scientific_name(scientific_name or "")
+        path = self._thumbnails.get(key)
+        if path is None:
+            key = " ".join(key.split()[:2])
+            path = self._thumbnails.get(key)
+        if path is None:
+            key = DEFAULT_KEY
+            path = self.default_image_path
+        return PlantMedia(key=key, path=path, file_id=self._file_ids.get(str(path)) if path else None)
+
+    def remember_file_id(self, media: PlantMedia, file_id: str) -> None:
+        """Cache the Telegram file_id returned after the first upload of a thumbnail."""
+        if media.path is None or self._file_ids.get(str(media.path)) == file_id:
+            return
+        self._file_ids[str(media.path)] = self._remembered[str(media.path)] = file_id
+        self._forgotten.pop(str(media.path), None)
+        self._save_file_ids()
+
+    def forget_file_id(self, media: PlantMedia) -> None:
+        """Drop a cached file_id Telegram no longer accepts, the next send uploads the file again."""
+        file_id = self._file_ids.pop(str(media.path), None) if media.path else None
+        if file_id is None:
+            return
+        self._remembered.pop(str(media.path), None)
+        self._forgotten[str(media.path)] = file_id
+        self._save_file_ids()
+
+
+def build_thumbnails(catalog_path: Path, source_dir: Path, media_dir: Path,
+                     max_size: int = THUMBNAIL_MAX_SIZE, quality: int = THUMBNAIL_QUALITY) -> int:
+    """Offline step: turn raw plant photos into size-optimized JPEG thumbnails.
+
+    Source images are matched by slug (``ficus_benjamina.png``) or by the
+    scientific name itself (``Ficus benjamina.jpg``).
+    """
+    from PIL import Image, ImageOps
+
+    media_dir.mkdir(parents=True, exist_ok=True)
+    sources = {}
+    for source in source_dir.iterdir():
+        if source.suffix.lower() in SOURCE_EXTENSIONS:
+            sources[thumbnail_slug(source.stem)] = source
+
+    built = 0
+    stale_file_ids = set()
+    for record in load_plant_catalog(catalog_path):
+        slug = thumbnail_slug(record.scientific_name)
+        source = sources.get(slug)
+        if source is None:
+            logger.warning("No source image for %s", record.scientific_name)
+            continue
+
+        thumbnail_path = media_dir / f"{slug}.jpg"
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((max_size, max_size), Image.LANCZOS)
+            img.save(thumbnail_path, format="JPEG", quality=quality, optimize=True, progressive=True)
+        stale_file_ids.add(str(thumbnail_path))
+        built += 1
+
+    # Rebuilt thumbnails must be re-uploaded to Telegram once
+    file_id_cache_path = media_dir / "file_ids.json"
+    if stale_file_ids and file_id_cache_path.exists():
+        with file_id_cache_path.open(encoding="utf-8") as cache_file:
+            file_ids = json.load(cache_file)
+        file_ids = {path: file_id for path, file_id in file_ids.items() if path not in stale_file_ids}
+        with file_id_cache_path.open("w", encoding="utf-8") as cache_file:
+            json.dump(file_ids, cache_file, ensure_ascii=False, indent=2)
+    return built
+
+
+# Usage: python plant_media.py raw_plant_photos/
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Build plant thumbnails for the bot.")
+    parser.add_argument("source_dir", type=Path, help="Directory with raw plant photos")
+    parser.add_argument("--catalog", type=Path, default=Path("plants_sample.csv"))
+    parser.add_argument("--media-dir", type=Path, default=Path("public") / "plants")
+    parser.add_argument("--max-size", type=int, default=THUMBNAIL_MAX_SIZE)
+    parser.add_argument("--quality", type=int, default=THUMBNAIL_QUALITY)
+    args = parser.parse_args()
+    count = build_thumbnails(args.catalog, args.source_dir, args.media_dir, args.max_size, args.quality)
+    print(f"Built {count} thumbnails in {args.media_dir}")
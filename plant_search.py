@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Set
+
+from catalog import PlantRecord, load_plant_catalog, normalize_scientific_name
+
+logger = logging.getLogger(__name__)
+
+ZWNJ = "\u200c"
+# Arabic code points users type instead of the Persian ones, and both digit sets
+_CHAR_FOLDING = str.maketrans({
+    "ي": "ی", "ى": "ی", "ئ": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ؤ": "و",
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # Persian digits
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic digits
+})
+# Harakat, tatweel and other marks that do not change the word
+_IGNORED_MARKS = re.compile("[\u064b-\u065f\u0670\u0640\u200d\u200e\u200f]")
+_SEPARATORS = re.compile(f"[\\s{ZWNJ}\\-_,.،؛()]+")
+
+
+def normalize_text(text: str) -> str:
+    """Fold Arabic/Persian letter variants and digits, drop diacritics, lower-case Latin."""
+    return _IGNORED_MARKS.sub("", text.translate(_CHAR_FOLDING)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text on spaces and ZWNJ, also keeping ZWNJ-joined words whole.
+
+    'برگ‌ریز' yields 'برگ', 'ریز' and 'برگریز', so it is found however the user types it.
+    """
+    text = normalize_text(text)
+    tokens = [token for token in _SEPARATORS.split(text) if token]
+    for word in text.split():
+        joined = word.replace(ZWNJ, "")
+        if joined != word:
+            tokens.append(joined)
+    return tokens
+
+
+class _TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Every plant having a token that starts with the path to this node
+        self.keys: Set[str] = set()
+
+
+class PlantIndex:
+    """In-memory search over the plant catalog by Persian or scientific name.
+
+    Exact tokens are looked up in an inverted index, partial words in a
+    prefix trie. ``reload_if_changed`` re-reads the CSV and only re-indexes
+    plants that were added, changed or removed.
+    """
+
+    def __init__(self, catalog_path: Path):
+        self.catalog_path = catalog_path
+        self._mtime = 0.0
+        self._records: Dict[str, PlantRecord] = {}
+        self._full_names: Dict[str, Set[str]] = {}
+        self._inverted: Dict[str, Set[str]] = {}
+        self._trie = _TrieNode()
+        self.reload_if_changed()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def records(self) -> List[PlantRecord]:
+        return list(self._records.values())
+
+    @staticmethod
+    def _names(record: PlantRecord) -> List[str]:
+        return [record.persian_name, record.scientific_name]
+
+    def _tokens(self, record: PlantRecord) -> Set[str]:
+        return {token for name in self._names(record) for token in tokenize(name)}
+
+    def _add(self, key: str, record: PlantRecord) -> None:
+        self._records[key] = record
+        for name in self._names(record):
+            self._full_names.setdefault(" ".join(tokenize(name)), set()).add(key)
+        for token in self._tokens(record):
+            self._inverted.setdefault(token, set()).add(key)
+            node = self._trie
+            for char in token:
+                node = node.children.setdefault(char, _TrieNode())
+                node.keys.add(key)
+
+    def _remove(self, key: str) -> None:
+        record = self._records.pop(key)
+        for name in self._names(record):
+            self._discard(self._full_names, " ".join(tokenize(name)), key)
+        tokens = self._tokens(record)
+        for token in tokens:
+            self._discard(self._inverted, token, key)
+        # Tokens of one plant share trie nodes, so walk each prefix once, deepest first
+        prefixes = {token[:end] for token in tokens for end in range(1, len(token) + 1)}
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            parent = self._trie
+            for char in prefix[:-1]:
+                parent = parent.children[char]
+            node = parent.children[prefix[-1]]
+            node.keys.discard(key)
+            if not node.keys:
+                del parent.children[prefix[-1]]
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], token: str, key: str) -> None:
+        keys = index.get(token)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[token]
+
+    def reload_if_changed(self) -> bool:
+        """Re-index the catalog if the CSV changed on disk. Returns True if it did."""
+        try:
+            mtime = os.stat(self.catalog_path).st_mtime
+            if mtime == self._mtime:
+                return False
+            records = {normalize_scientific_name(record.scientific_name): record
+                       for record in load_plant_catalog(self.catalog_path)}
+        except OSError as e:
+            logger.error("Unable to read plant catalog %s: %s", self.catalog_path, e)
+            return False
+
+        removed = [key for key in self._records if key not in records]
+        changed = [key for key, record in records.items() if self._records.get(key) != record]
+        for key in removed:
+            self._remove(key)
+        for key in changed:
+            if key in self._records:
+                self._remove(key)
+            self._add(key, records[key])
+        self._mtime = mtime
+        logger.info("Plant index: %d plants, %d updated, %d removed", len(self._records), len(changed), len(removed))
+        return True
+
+    def _prefix_keys(self, prefix: str) -> Set[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.keys
+
+    def search(self, query: str, limit: int = 5) -> List[PlantRecord]:
+        """Plants whose names contain every word of the query, whole or as the start of a word."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        exact_name = self._full_names.get(" ".join(tokens), set())
+        matches = None
+        for token in tokens:
+            keys = self._prefix_keys(token)  # A whole word is a prefix of itself
+            matches = keys if matches is None else matches & keys
+            if not matches:
+                break
+        matches = (matches or set()) | exact_name
+
+        # Exact full name first, then more whole-word hits, then shorter names
+        def rank(key: str):
+            record = self._records[key]
+            whole_words = sum(key in self._inverted.get(token, ()) for token in tokens)
+            return key not in exact_name, -whole_words, len(record.persian_name), key
+
+        return [self._records[key] for key in sorted(matches, key=rank)[:limit]]
@@ -0,0 +1,116 @@
+import csv
+import os
+import tempfile
+from pathlib import Path
+from typing import List
+
+from catalog import PlantRecord
+from plant_search import PlantIndex, _TrieNode, normalize_text, tokenize
+
+CATALOG = [
+    PlantRecord("انجیر برگ‌ریز", "Ficus benjamina", "درختچه زینتی"),
+    PlantRecord("انجیر لیراتا", "Ficus lyrata", "برگ‌های پهن"),
+    PlantRecord("گل چمچه‌ای", "Spathiphyllum wallisii", "گل صلح"),
+    PlantRecord("کاکتوس کریسمس", "Schlumbergera truncata", "گل‌دهی زمستانه"),
+    PlantRecord("پتوس", "Epipremnum aureum", "رونده"),
+]
+
+
+def write_catalog(path: Path, records: List[PlantRecord], mtime: float) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["Persian Name", "Scientific Name", "Description"])
+        writer.writerows(records)
+    # Some filesystems keep whole-second mtimes, set it so every write counts as a change
+    os.utime(path, (mtime, mtime))
+
+
+def trie_state(node: _TrieNode, prefix: str = "") -> dict:
+    """Every trie path with its plant keys. Nodes left without keys show up too."""
+    state = {prefix: frozenset(node.keys)} if prefix else {}
+    for char, child in node.children.items():
+        state.update(trie_state(child, prefix + char))
+    return state
+
+
+def index_state(index: PlantIndex) -> tuple:
+    return index._records, index._full_names, index._inverted, trie_state(index._trie)
+
+
+def check_normalization() -> None:
+    assert normalize_text("كاكتوس") == "کاکتوس"  # Arabic kaf
+    assert normalize_text("پيلئا") == normalize_text("پیلیا")  # Arabic yeh, yeh with hamza
+    assert normalize_text("۱۲٣") == "123"
+    assert normalize_text("Ficus") == "ficus"
+    assert tokenize("برگ‌ریز") == ["برگ", "ریز", "برگریز"]
+
+
+def check_search(index: PlantIndex) -> None:
+    def names(query: str) -> List[str]:
+        return [record.scientific_name for record in index.search(query)]
+
+    assert names("انجیر") == ["Ficus lyrata", "Ficus benjamina"]  # Shorter name first
+    assert names("انجیر برگ‌ریز")[0] == "Ficus benjamina"
+    # The same name typed with Arabic letters, without ZWNJ, or with a space
+    assert names("كاكتوس كريسمس") == ["Schlumbergera truncata"]
+    assert names("برگریز") == ["Ficus benjamina"]
+    assert names("برگ ریز") == ["Ficus benjamina"]
+    # Partial words and scientific names
+    assert names("چمچ") == ["Spathiphyllum wallisii"]
+    assert set(names("fic")) == {"Ficus benjamina", "Ficus lyrata"}
+    assert names("FICUS LYR") == ["Ficus lyrata"]
+    assert names("انجیر کاکتوس") == []
+    assert names("") == [] and names("   ") == []
+
+
+def check_incremental_reload(directory: Path) -> None:
+    catalog_path = directory / "plants.csv"
+    write_catalog(catalog_path, CATALOG, mtime=1_000_000)
+    index = PlantIndex(catalog_path)
+    assert len(index) == len(CATALOG)
+    check_search(index)
+    assert not index.reload_if_changed()  # Unchanged file
+
+    updated = [
+        PlantRecord("انجیر برگ‌ریز", "Ficus benjamina", "درختچه زینتی"),
+        # Renamed: its old tokens must disappear from the trie and the inverted index
+        PlantRecord("انجیر ویولن", "Ficus lyrata", "برگ‌های پهن"),
+        PlantRecord("گل چمچه‌ای", "Spathiphyllum wallisii", "گل صلح و آرامش"),  # Description only
+        # The cactus removed, new plants added, one sharing prefixes with the removed one
+        PlantRecord("کاکتوس ماهی", "Epiphyllum anguliger", "کاکتوس جنگلی"),
+        PlantRecord("پتوس", "Epipremnum aureum", "رونده"),
+        PlantRecord("سانسوریا", "Sansevieria trifasciata", "مقاوم"),
+    ]
+    write_catalog(catalog_path, updated, mtime=1_000_060)
+    assert index.reload_if_changed()
+    fresh = PlantIndex(catalog_path)
+    assert index_state(index) == index_state(fresh)
+    # No empty nodes are left behind by removals
+    assert all(trie_state(index._trie).values())
+
+    assert [record.scientific_name for record in index.search("کریسمس")] == []
+    assert [record.scientific_name for record in index.search("لیرا")] == []
+    assert [record.scientific_name for record in index.search("ویولن")] == ["Ficus lyrata"]
+    assert [record.scientific_name for record in index.search("کاکت")] == ["Epiphyllum anguliger"]
+    assert index.search("گل چمچه‌ای")[0].description == "گل صلح و آرامش"
+
+    # Everything removed and added back ends where a fresh index starts
+    write_catalog(catalog_path, [], mtime=1_000_120)
+    assert index.reload_if_changed() and len(index) == 0
+    assert not index._trie.children and not index._inverted and not index._full_names
+    write_catalog(catalog_path, CATALOG, mtime=1_000_180)
+    assert index.reload_if_changed()
+    assert index_state(index) == index_state(PlantIndex(catalog_path))
+    check_search(index)
+
+
+def main() -> None:
+    check_normalization()
+    with tempfile.TemporaryDirectory() as directory:
+        check_incremental_reload(Path(directory))
+
+
+# Usage: python plant_search.spec.py
+if __name__ == "__main__":
+    main()
+    print("plant_search: all checks passed")
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+from log_setup import queued_file_logger
+
+logger = logging.getLogger(__name__)
+
+# Thresholds, tune them with the decisions recorded in QUALITY_GATE_LOG
+MIN_SIDE = int(os.getenv('QUALITY_MIN_SIDE', 320))
+MIN_BRIGHTNESS = float(os.getenv('QUALITY_MIN_BRIGHTNESS', 40))
+MAX_DARK_FRACTION = float(os.getenv('QUALITY_MAX_DARK_FRACTION', 0.85))
+MIN_SHARPNESS = float(os.getenv('QUALITY_MIN_SHARPNESS', 50))
+QUALITY_GATE_WORKERS = int(os.getenv('QUALITY_GATE_WORKERS', 2))
+QUALITY_GATE_LOG = Path(os.getenv('QUALITY_GATE_LOG', 'logs/quality_gate.jsonl'))
+
+# Statistics are computed on a copy scaled down to this size
+ANALYSIS_SIZE = 256
+# Pixels darker than this count as dark in the histogram
+DARK_LEVEL = 40
+
+VERDICT_OK = "ok"
+VERDICT_TOO_SMALL = "too_small"
+VERDICT_TOO_DARK = "too_dark"
+VERDICT_TOO_BLURRY = "too_blurry"
+
+
+class GateResult(NamedTuple):
+    verdict: str
+    width: int
+    height: int
+    brightness: float
+    dark_fraction: float
+    sharpness: float
+
+    @property
+    def accepted(self) -> bool:
+        return self.verdict == VERDICT_OK
+
+
+def assess_photo(file_path: str) -> GateResult:
+    """Compute brightness, dark share and Laplacian-variance sharpness of a photo.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+    """
+    with Image.open(file_path) as img:
+        width, height = img.size
+        # Let the JPEG decoder downscale while decoding, far cheaper than a full decode
+        img.draft("L", (ANALYSIS_SIZE * 2, ANALYSIS_SIZE * 2))
+        gray = img.convert("L")
+    gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    histogram = np.bincount(pixels.astype(np.uint8).ravel(), minlength=256)
+    brightness = float(pixels.mean())
+    dark_fraction = float(histogram[:DARK_LEVEL].sum() / pixels.size)
+
+    # 4-neighbour Laplacian, its variance drops as edges get soft
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    sharpness = float(laplacian.var()) if laplacian.size else 0.0
+
+    if min(width, height) < MIN_SIDE:
+        verdict = VERDICT_TOO_SMALL
+    elif brightness < MIN_BRIGHTNESS or dark_fraction > MAX_DARK_FRACTION:
+        verdict = VERDICT_TOO_DARK
+    elif sharpness < MIN_SHARPNESS:
+        verdict = VERDICT_TOO_BLURRY
+    else:
+        verdict = VERDICT_OK
+    return GateResult(verdict, width, height, round(brightness, 1), round(dark_fraction, 3), round(sharpness, 1))
+
+
+class QualityGate:
+    """Rejects unusable photos locally before they are uploaded to Metis."""
+
+    def __init__(self, workers: int = QUALITY_GATE_WORKERS, decision_log: Path = QUALITY_GATE_LOG):
+        self.workers = workers
+        self.decision_log = decision_log
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._decisions: Optional[logging.Logger] = None
+
+    def start(self) -> None:
+        """Create the worker pool and the decision log writer, call once at startup."""
+        if self._pool is None:
+            # The bot already runs threads (log writer, to_thread workers), forking it is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        if self._decisions is None:
+            try:
+                self._decisions = queued_file_logger("quality_gate.decisions", self.decision_log)
+            except OSError as e:
+                logger.error("Unable to record quality gate decisions: %s", e)
+
+    async def check(self, file_path: Path) -> Optional[GateResult]:
+        """Assess a photo in the worker pool. Returns None if it could not be assessed."""
+        if self._pool is None:
+            self.start()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, assess_photo, str(file_path))
+        except Exception as e:
+            # Never block a photo because the gate itself failed
+            logger.error("Quality gate failed for %s: %s", file_path, e)
+            return None
+        self._record(file_path, result)
+        return result
+
+    def _record(self, file_path: Path, result: GateResult) -> None:
+        """Queue the decision for the log writer thread, nothing blocks the event loop."""
+        if self._decisions is not None:
+            record = {"time": int(time.time()), "file": file_path.name, **result._asdict()}
+            self._decisions.info(json.dumps(record))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
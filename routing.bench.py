@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+import routing
+from routing import HedgedRouter
+from scheduler import FairScheduler
+
+REQUESTS = 300
+# Below the Metis thread pool size, like METIS_MAX_CONCURRENCY in the bot
+CONCURRENCY = 2
+# Time scale of the simulated Metis: most replies are quick, a few stall
+TYPICAL = 0.02
+STALL = 0.5
+STALL_RATE = 0.05
+
+
+def fake_analyze() -> dict:
+    time.sleep(STALL if random.random() < STALL_RATE else random.uniform(0.5, 1.5) * TYPICAL)
+    return {"plants": [], "error": None}
+
+
+def fallback() -> dict:
+    return {"plants": [], "error": None, "fallback": True}
+
+
+async def measure(label: str, router: HedgedRouter) -> None:
+    random.seed(7)
+    # CONCURRENCY users at a time, admitted like in the bot
+    users = asyncio.Semaphore(CONCURRENCY)
+    scheduler = router.scheduler or FairScheduler(max_concurrency=CONCURRENCY)
+    timings = []
+
+    async def one() -> None:
+        async with users, scheduler.slot(0, 0):
+            start = time.perf_counter()
+            await router.route(fake_analyze, fake_analyze, fallback)
+            timings.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    p99 = statistics.quantiles(timings, n=100)[-1]
+    metrics = router.metrics()
+    print(f"{label:<22} p50 {statistics.median(timings) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  "
+          f"hedge rate {metrics['hedge_rate']:.3f}  fallback rate {metrics['fallback_rate']:.3f}  "
+          f"hedges skipped {metrics['hedges_skipped']}")
+
+
+# Usage: python routing.bench.py
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    routing.HEDGE_INITIAL_DEADLINE = 4 * TYPICAL
+    routing.HEDGE_MIN_DEADLINE = TYPICAL
+    asyncio.run(measure("no hedging", HedgedRouter(budget=10, hedge_enabled=False)))
+    asyncio.run(measure("hedged at p95", HedgedRouter(budget=10, percentile=0.95)))
+    asyncio.run(measure("hedged, 0.2 s budget", HedgedRouter(budget=0.2, percentile=0.95)))
+    # Hedges and abandoned calls take scheduler slots, one spare slot is left for them
+    asyncio.run(measure("hedged, 1 spare slot", HedgedRouter(budget=0.2, percentile=0.95,
+                                                             scheduler=FairScheduler(CONCURRENCY + 1))))
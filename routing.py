@@ -0,0 +1,251 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+
+from telegram.ext import ContextTypes
+
+from catalog import PlantRecord
+from model import BAD_IMAGE_ERROR, LATENCY_BUDGET
+from scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# A duplicate Metis request is sent once the primary is slower than this percentile
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 0.95))
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', '1') == '1'
+HEDGE_MIN_DEADLINE = float(os.getenv('HEDGE_MIN_DEADLINE', 5))
+# Used until enough latencies were observed
+HEDGE_INITIAL_DEADLINE = float(os.getenv('HEDGE_INITIAL_DEADLINE', 20))
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+ROUTING_METRICS_INTERVAL = int(os.getenv('ROUTING_METRICS_INTERVAL', 600))
+# Threads for blocking Metis analyses, apart from the default executor so stalled calls cannot starve it
+METIS_THREADS = int(os.getenv('METIS_THREADS', 8))
+# Threads for speculative uploads and session setup, so they never queue ahead of analyses holding a slot
+METIS_UPLOAD_THREADS = int(os.getenv('METIS_UPLOAD_THREADS', 4))
+
+metis_executor = ThreadPoolExecutor(max_workers=METIS_THREADS, thread_name_prefix="metis")
+upload_executor = ThreadPoolExecutor(max_workers=METIS_UPLOAD_THREADS, thread_name_prefix="metis-upload")
+
+
+def submit_upload(func: Callable, *args) -> Future:
+    """Queue a blocking Metis call outside the analysis path (upload, session setup or cleanup).
+
+    Like ``asyncio.to_thread`` it carries over the caller's context, so the
+    call logs under the flow's correlation ID.
+    """
+    return upload_executor.submit(contextvars.copy_context().run, func, *args)
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies per endpoint."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, endpoint: str) -> int:
+        return len(self._samples.get(endpoint, ()))
+
+    def percentile(self, endpoint: str, fraction: float) -> Optional[float]:
+        samples = self._samples.get(endpoint)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LocalRecommender:
+    """Quick recommendations from the local plant catalog, used when Metis is too slow.
+
+    Only plants whose description suits the environment are suggested. With
+    none, the answer is an error rather than plants meant for elsewhere.
+    """
+
+    # Description phrases hinting at where a plant does well. Houseplants are also
+    # described as hardy or wanting bright indirect light, so those are no outdoor hints.
+    INDOOR_HINTS = ("نور کم", "نور غیرمستقیم", "نور متوسط", "رطوبت")
+    OUTDOOR_HINTS = ("نور مستقیم", "آفتاب", "فضای باز", "باغچه", "حیاط")
+    SEASON_HINTS = {"spring": "بهار", "summer": "تابستان", "autumn": "پاییز", "winter": "زمستان"}
+
+    def __init__(self, records: Callable[[], List[PlantRecord]]):
+        self.records = records
+
+    def recommend(self, environment: str, selected_city: str, season: str, count: int = 2) -> dict:
+        hints = self.INDOOR_HINTS if environment == "indoor" else self.OUTDOOR_HINTS
+        season_hint = self.SEASON_HINTS.get(season, "")
+        # Rotate ties by city and season so everybody does not get the same two plants
+        salt = zlib.crc32(f"{selected_city}:{season}".encode())
+
+        def score(record: PlantRecord):
+            matches = sum(hint in record.description for hint in hints)
+            in_season = bool(season_hint) and season_hint in record.description
+            return -(matches + 2 * in_season), zlib.crc32(record.scientific_name.encode()) ^ salt
+
+        suitable = [record for record in self.records() if any(hint in record.description for hint in hints)]
+        if not suitable:
+            logger.warning("No catalog plant suits %s spaces, no local answer", environment)
+            return {"plants": [], "error": f"No catalog plant suits {environment} spaces", "fallback": True}
+        chosen = sorted(suitable, key=score)[:count]
+        return {"plants": [record.as_plant_info() for record in chosen], "error": None, "fallback": True}
+
+
+class _Attempt:
+    __slots__ = ("future", "outcome", "start", "holds_slot")
+
+    def __init__(self, future: Future, outcome: str, holds_slot: bool):
+        self.future = future
+        self.outcome = outcome
+        self.start = time.monotonic()
+        # Whether the attempt itself counts against the scheduler, rather than the caller's slot
+        self.holds_slot = holds_slot
+
+
+class HedgedRouter:
+    """Runs a Metis analysis under a latency budget.
+
+    If the primary call is slower than the adaptive deadline (a percentile of
+    recent latencies), a duplicate request is raced against it. If nothing
+    useful arrives within the budget, the local fallback answers.
+
+    A blocking HTTP request cannot be cancelled once its thread runs it, so
+    calls run on ``executor`` and keep counting against ``scheduler`` until
+    they really finish: a hedge is only sent when a slot is free, and a call
+    still running after ``route`` returns takes a slot of its own. With a
+    single slot (e.g. METIS_MAX_CONCURRENCY split across as many workers)
+    the primary's caller always holds it and hedging never fires.
+    """
+
+    def __init__(self, endpoint: str = "metis.analyze", tracker: Optional[LatencyTracker] = None,
+                 budget: float = LATENCY_BUDGET, percentile: float = HEDGE_PERCENTILE,
+                 hedge_enabled: bool = HEDGE_ENABLED, scheduler: Optional[FairScheduler] = None,
+                 executor: Executor = metis_executor):
+        self.endpoint = endpoint
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget
+        self.percentile = percentile
+        self.hedge_enabled = hedge_enabled
+        self.scheduler = scheduler
+        self.executor = executor
+        self.counters = {"requests": 0, "hedges": 0, "hedges_skipped": 0, "primary_wins": 0, "hedge_wins": 0,
+                         "fallbacks": 0}
+
+    def hedge_deadline(self) -> float:
+        if self.tracker.count(self.endpoint) < LATENCY_MIN_SAMPLES:
+            deadline = HEDGE_INITIAL_DEADLINE
+        else:
+            deadline = self.tracker.percentile(self.endpoint, self.percentile)
+        return min(max(deadline, HEDGE_MIN_DEADLINE), self.budget)
+
+    async def route(self, primary: Callable[[], dict], hedge: Optional[Callable[[], dict]],
+                    fallback: Callable[[], dict]) -> dict:
+        """Return the first successful result of ``primary``/``hedge``, or ``fallback()`` after the budget.
+
+        The caller holds a scheduler slot for the primary while this runs.
+        """
+        self.counters["requests"] += 1
+        start = time.monotonic()
+        attempts: Dict[asyncio.Future, _Attempt] = {}
+        self._submit(attempts, primary, "primary_wins", holds_slot=False)
+        hedge_pending = self.hedge_enabled and hedge is not None
+        last_result = None
+        try:
+            hedge_at = start + self.hedge_deadline()
+            deadline = start + self.budget
+            while attempts:
+                now = time.monotonic()
+                wait_until = hedge_at if hedge_pending and hedge_at < deadline else deadline
+                done, _ = await asyncio.wait(attempts, timeout=max(0.0, wait_until - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for waiter in done:
+                    attempt = attempts.pop(waiter)
+                    result = waiter.result()
+                    self.tracker.record(self.endpoint, time.monotonic() - attempt.start)
+                    if result.get("error") is None:
+                        self.counters[attempt.outcome] += 1
+                        return result
+                    if result["error"] == BAD_IMAGE_ERROR:
+                        # The photo is unusable, no other attempt or catalog answer changes that
+                        return result
+                    last_result = result
+                if done:
+                    continue
+                if time.monotonic() >= deadline:
+                    break
+                if hedge_pending:
+                    hedge_pending = False
+                    if self.scheduler is not None and not self.scheduler.try_occupy():
+                        self.counters["hedges_skipped"] += 1
+                        logger.info("Metis slower than %.1fs but no slot is free for a hedged request",
+                                    hedge_at - start)
+                        continue
+                    self.counters["hedges"] += 1
+                    logger.info("Metis slower than %.1fs, sending a hedged request", hedge_at - start)
+                    self._submit(attempts, hedge, "hedge_wins", holds_slot=self.scheduler is not None)
+        finally:
+            for waiter, attempt in attempts.items():
+                # Only a call still queued for a thread can be cancelled, a running one is left to its timeout.
+                # A call that already finished (e.g. in the same wakeup as the winner) has nothing to hold.
+                if not attempt.future.cancel() and not attempt.future.done() and not attempt.holds_slot \
+                        and self.scheduler is not None:
+                    self.scheduler.occupy()
+                    attempt.holds_slot = True
+                waiter.cancel()
+
+        if last_result is not None and not attempts:
+            # Every attempt answered in time with an error (e.g. badImage), that is the answer
+            return last_result
+        self.counters["fallbacks"] += 1
+        logger.warning("Metis missed the %.0fs latency budget, answering from the local catalog", self.budget)
+        return fallback()
+
+    def _submit(self, attempts: Dict[asyncio.Future, _Attempt], call: Callable[[], dict], outcome: str,
+                holds_slot: bool) -> None:
+        loop = asyncio.get_running_loop()
+        attempt = _Attempt(self.executor.submit(contextvars.copy_context().run, call), outcome, holds_slot)
+
+        def on_done(_: Future) -> None:
+            try:
+                loop.call_soon_threadsafe(self._finished, attempt)
+            except RuntimeError:
+                pass  # The loop is closed, and the scheduler with it
+
+        # Added before wrap_future's callback, so the attempt is accounted for before route sees it done
+        attempt.future.add_done_callback(on_done)
+        attempts[asyncio.wrap_future(attempt.future)] = attempt
+
+    def _finished(self, attempt: _Attempt) -> None:
+        """On the event loop, once the thread of an attempt is done, or it was cancelled before starting."""
+        if attempt.holds_slot:
+            self.scheduler.release()
+
+    def metrics(self) -> dict:
+        requests = self.counters["requests"] or 1
+        return {
+            **self.counters,
+            "hedge_rate": round(self.counters["hedges"] / requests, 3),
+            "primary_win_rate": round(self.counters["primary_wins"] / requests, 3),
+            "hedge_win_rate": round(self.counters["hedge_wins"] / requests, 3),
+            "fallback_rate": round(self.counters["fallbacks"] / requests, 3),
+            "p50": self.tracker.percentile(self.endpoint, 0.5),
+            "p99": self.tracker.percentile(self.endpoint, 0.99),
+            "hedge_deadline": round(self.hedge_deadline(), 2),
+        }
+
+
+async def log_routing_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback: report win and hedge rates. The job's data is the router."""
+    metrics = context.job.data.metrics()
+    logger.info("Routing metrics: %s", metrics, extra=metrics)
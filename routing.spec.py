@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import routing
+from catalog import PlantRecord
+from log_setup import _ContextFilter, correlation_id
+from model import BAD_IMAGE_ERROR
+from routing import HedgedRouter, LocalRecommender, submit_upload
+from scheduler import FairScheduler
+
+OK = {"plants": [{"scientificName": "Ficus lyrata"}], "error": None}
+BAD_IMAGE = {"plants": [], "error": BAD_IMAGE_ERROR}
+UNAVAILABLE = {"plants": [], "error": "Unable to retrieve plant recommendations at this time."}
+
+
+def fallback() -> dict:
+    return {"plants": [], "error": None, "fallback": True}
+
+
+def reply(result: dict, release: threading.Event = None) -> Callable[[], dict]:
+    """A stand-in Metis call answering ``result``, once ``release`` is set if given."""
+    def call() -> dict:
+        if release is not None:
+            assert release.wait(5), "the spec never released this call"
+        return result
+    return call
+
+
+async def eventually(condition: Callable[[], bool]) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+
+def make_router(scheduler: FairScheduler, executor: ThreadPoolExecutor, budget: float = 0.3,
+                hedge_enabled: bool = True) -> HedgedRouter:
+    return HedgedRouter(budget=budget, hedge_enabled=hedge_enabled, scheduler=scheduler, executor=executor)
+
+
+async def check_primary_wins(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    async with scheduler.slot(1, 1):
+        assert await router.route(reply(OK), reply(OK), fallback) is OK
+        assert scheduler.in_flight == 1
+    assert router.counters["primary_wins"] == 1 and router.counters["hedges"] == 0
+    assert router.tracker.count(router.endpoint) == 1
+
+
+async def check_hedge_wins(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    stalled = threading.Event()
+    async with scheduler.slot(1, 1):
+        assert await router.route(reply(BAD_IMAGE, stalled), reply(OK), fallback) is OK
+        # The abandoned primary still runs and keeps a slot of its own
+        assert scheduler.in_flight == 2
+    assert router.counters["hedges"] == 1 and router.counters["hedge_wins"] == 1
+    assert scheduler.in_flight == 1
+    stalled.set()
+    await eventually(lambda: scheduler.in_flight == 0)
+    # Only the latencies route waited for count towards the hedge deadline
+    assert router.tracker.count(router.endpoint) == 1
+
+
+async def check_both_finish_in_one_wakeup(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    # Which of the two route looks at first is up to set order, try often enough to see both
+    for trial in range(1, 21):
+        release = threading.Event()
+
+        def finish_both_while_the_loop_is_busy() -> None:
+            release.set()
+            time.sleep(0.02)  # Both threads end before the loop looks at them again
+
+        asyncio.get_running_loop().call_later(0.05, finish_both_while_the_loop_is_busy)
+        async with scheduler.slot(1, 1):
+            assert await router.route(reply(OK, release), reply(OK, release), fallback) is OK
+        assert router.counters["hedges"] == trial
+        # The finished loser must not take a slot nobody releases
+        await eventually(lambda: scheduler.in_flight == 0)
+
+
+async def check_hedge_needs_a_free_slot(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=1)
+    router = make_router(scheduler, executor)
+    slow = threading.Event()
+    threading.Timer(0.1, slow.set).start()
+    async with scheduler.slot(1, 1):
+        assert await router.route(reply(OK, slow), reply(OK), fallback) is OK
+    assert router.counters["hedges_skipped"] == 1 and router.counters["hedges"] == 0
+    assert router.counters["primary_wins"] == 1 and scheduler.in_flight == 0
+
+
+async def check_fallback(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    stalled = threading.Event()
+    async with scheduler.slot(1, 1):
+        result = await router.route(reply(OK, stalled), reply(OK, stalled), fallback)
+        assert result.get("fallback") and router.counters["fallbacks"] == 1
+        # The abandoned primary goes over the limit rather than going uncounted
+        assert scheduler.in_flight == 3
+    # Both calls keep their slots until their threads are done, new requests wait for them
+    assert scheduler.in_flight == 2
+    waiting = asyncio.create_task(scheduler.acquire(2, 2))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    stalled.set()
+    await eventually(waiting.done)
+    scheduler.release()
+    await eventually(lambda: scheduler.in_flight == 0)
+
+
+async def check_queued_call_is_cancelled() -> None:
+    # One thread only: the hedge waits behind the stalled primary and never starts
+    executor = ThreadPoolExecutor(max_workers=1)
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    stalled = threading.Event()
+    hedge_ran = threading.Event()
+
+    def hedge() -> dict:
+        hedge_ran.set()
+        return OK
+
+    async with scheduler.slot(1, 1):
+        result = await router.route(reply(OK, stalled), hedge, fallback)
+        assert result.get("fallback")
+    await eventually(lambda: scheduler.in_flight == 1)  # The hedge's slot is back, the primary's is not
+    stalled.set()
+    await eventually(lambda: scheduler.in_flight == 0)
+    executor.shutdown(wait=True)
+    assert not hedge_ran.is_set()
+
+
+async def check_errors_pass_through(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor, hedge_enabled=False)
+    async with scheduler.slot(1, 1):
+        assert await router.route(reply(BAD_IMAGE), None, fallback) is BAD_IMAGE
+    assert router.counters["fallbacks"] == 0
+
+    # Both attempts answer with an error before the budget: that error is the answer
+    router = make_router(scheduler, executor)
+    slow = threading.Event()
+    threading.Timer(0.1, slow.set).start()
+    async with scheduler.slot(1, 1):
+        assert await router.route(reply(BAD_IMAGE, slow), reply(BAD_IMAGE, slow), fallback) is BAD_IMAGE
+    await eventually(lambda: scheduler.in_flight == 0)
+    assert router.counters["fallbacks"] == 0
+
+
+async def check_bad_image_beats_the_fallback(executor: ThreadPoolExecutor) -> None:
+    scheduler = FairScheduler(max_concurrency=2)
+    router = make_router(scheduler, executor)
+    slow, stalled = threading.Event(), threading.Event()
+    threading.Timer(0.1, slow.set).start()
+    async with scheduler.slot(1, 1):
+        # The primary finds the photo unusable after the hedge went out, the hedge never answers
+        assert await router.route(reply(BAD_IMAGE, slow), reply(OK, stalled), fallback) is BAD_IMAGE
+    assert router.counters["hedges"] == 1 and router.counters["fallbacks"] == 0
+    stalled.set()
+    await eventually(lambda: scheduler.in_flight == 0)
+
+    # Other errors still leave the answer to the hedge or, past the budget, the fallback
+    router = make_router(scheduler, executor)
+    slow, stalled = threading.Event(), threading.Event()
+    threading.Timer(0.1, slow.set).start()
+    async with scheduler.slot(1, 1):
+        assert (await router.route(reply(UNAVAILABLE, slow), reply(OK, stalled), fallback)).get("fallback")
+    stalled.set()
+    await eventually(lambda: scheduler.in_flight == 0)
+
+
+def check_local_recommender() -> None:
+    catalog = [
+        PlantRecord("پتوس", "Epipremnum aureum", "مناسب نور کم و رطوبت متوسط"),
+        PlantRecord("زاموفیلیا", "Zamioculcas zamiifolia", "گیاهی مقاوم با نیاز به نور زیاد غیرمستقیم"),
+        PlantRecord("کاکتوس کریسمس", "Schlumbergera truncata", "در زمستان گل می‌دهد"),
+        PlantRecord("شمشاد", "Buxus sempervirens", "برای حیاط و باغچه، آفتاب کامل را تحمل می‌کند"),
+    ]
+    recommender = LocalRecommender(lambda: catalog)
+    indoor = recommender.recommend("indoor", "Tabriz", "winter")
+    assert [plant["scientificName"] for plant in indoor["plants"]] == ["Epipremnum aureum"]
+    assert indoor["error"] is None and indoor["fallback"]
+    outdoor = recommender.recommend("outdoor", "Tabriz", "winter")
+    assert [plant["scientificName"] for plant in outdoor["plants"]] == ["Buxus sempervirens"]
+
+    # Houseplants are never offered for a yard, even in their season
+    recommender = LocalRecommender(lambda: catalog[:3])
+    outdoor = recommender.recommend("outdoor", "Tabriz", "winter")
+    assert outdoor["plants"] == [] and outdoor["error"] is not None
+
+
+class Captured(logging.Handler):
+    """Keeps records stamped by the same filter as the real log pipeline."""
+
+    def __init__(self):
+        super().__init__()
+        self.addFilter(_ContextFilter(sample_rate=1.0))
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+async def check_threads_log_under_the_flow(executor: ThreadPoolExecutor) -> None:
+    logger = logging.getLogger("routing.spec")
+    captured = Captured()
+    logger.addHandler(captured)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    def analyze() -> dict:
+        logger.info("analyzing")
+        return OK
+
+    correlation_id.set("flow-1")
+    scheduler = FairScheduler(max_concurrency=2)
+    async with scheduler.slot(1, 1):
+        await make_router(scheduler, executor).route(analyze, None, fallback)
+    await asyncio.wrap_future(submit_upload(logger.info, "uploading"))
+    assert [(record.getMessage(), record.correlation_id) for record in captured.records] == [
+        ("analyzing", "flow-1"), ("uploading", "flow-1")], captured.records
+    correlation_id.set("-")
+
+
+async def main() -> None:
+    routing.HEDGE_INITIAL_DEADLINE = 0.03
+    routing.HEDGE_MIN_DEADLINE = 0.01
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        await check_primary_wins(executor)
+        await check_hedge_wins(executor)
+        await check_both_finish_in_one_wakeup(executor)
+        await check_hedge_needs_a_free_slot(executor)
+        await check_fallback(executor)
+        await check_errors_pass_through(executor)
+        await check_bad_image_beats_the_fallback(executor)
+        await check_threads_log_under_the_flow(executor)
+    check_local_recommender()
+    await check_queued_call_is_cancelled()
+
+
+# Usage: python routing.spec.py
+if __name__ == "__main__":
+    asyncio.run(main())
+    print("routing: all checks passed")
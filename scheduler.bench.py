@@ -0,0 +1,92 @@
+import asyncio
+import random
+import statistics
+import time
+
+from scheduler import FairScheduler, SlidingWindowQuota, QuotaExceeded, PRIORITY_FIRST_TIME, PRIORITY_REPEAT
+
+CONCURRENCY = 4
+SERVICE_TIME = (0.02, 0.06)  # Simulated Metis round trip, seconds
+HEAVY_CHATS = 2  # Power users / group chats flooding photos at t=0
+HEAVY_PHOTOS = 40
+LIGHT_CHATS = 30  # Regular users arriving over time
+LIGHT_ARRIVAL_SPAN = 1.0
+
+
+def generate_workload(seed: int = 0):
+    """Return (arrival_time, chat_id, priority) tuples."""
+    rng = random.Random(seed)
+    workload = []
+    for chat_id in range(HEAVY_CHATS):
+        workload += [(0.0, chat_id, PRIORITY_REPEAT)] * HEAVY_PHOTOS
+    for chat_id in range(HEAVY_CHATS, HEAVY_CHATS + LIGHT_CHATS):
+        priority = PRIORITY_FIRST_TIME if rng.random() < 0.5 else PRIORITY_REPEAT
+        for _ in range(rng.randint(1, 2)):
+            workload.append((rng.uniform(0, LIGHT_ARRIVAL_SPAN), chat_id, priority))
+    return sorted(workload)
+
+
+class FifoScheduler:
+    """Baseline: first come, first served with the same concurrency limit."""
+
+    def __init__(self, max_concurrency: int):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self, chat_id, user_id, priority, cost=1):
+        await self._semaphore.acquire()
+
+    def release(self):
+        self._semaphore.release()
+
+
+async def run(scheduler, workload, seed: int = 0):
+    rng = random.Random(seed)
+    waits = {}
+    rejected = 0
+    start = time.monotonic()
+
+    async def request(arrival, chat_id, priority):
+        nonlocal rejected
+        await asyncio.sleep(arrival)
+        queued_at = time.monotonic()
+        try:
+            await scheduler.acquire(chat_id, chat_id, priority)
+        except QuotaExceeded:
+            rejected += 1
+            return
+        waits.setdefault(chat_id, []).append(time.monotonic() - queued_at)
+        try:
+            await asyncio.sleep(rng.uniform(*SERVICE_TIME))
+        finally:
+            scheduler.release()
+
+    await asyncio.gather(*(request(*item) for item in workload))
+    return waits, rejected, time.monotonic() - start
+
+
+def report(label, waits, rejected, elapsed):
+    heavy = [w for chat_id, chat_waits in waits.items() if chat_id < HEAVY_CHATS for w in chat_waits]
+    light = [w for chat_id, chat_waits in waits.items() if chat_id >= HEAVY_CHATS for w in chat_waits]
+
+    def summary(values):
+        if not values:
+            return "n/a"
+        p95 = statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+        return f"mean {statistics.mean(values) * 1000:6.0f} ms  p95 {p95 * 1000:6.0f} ms"
+
+    print(f"{label:<22} light chats: {summary(light)} | heavy chats: {summary(heavy)} | "
+          f"rejected {rejected:3d} | total {elapsed:.2f}s")
+
+
+async def main():
+    workload = generate_workload()
+    print(f"{len(workload)} requests, {HEAVY_CHATS} heavy chats x {HEAVY_PHOTOS} photos, "
+          f"{LIGHT_CHATS} light chats, concurrency {CONCURRENCY}")
+    report("FIFO", *await run(FifoScheduler(CONCURRENCY), workload))
+    report("DRR", *await run(FairScheduler(CONCURRENCY), workload))
+    report("DRR + quota 10/min", *await run(FairScheduler(CONCURRENCY, quota=SlidingWindowQuota(10, 60)), workload))
+
+
+# Usage: python scheduler.bench.py
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+METIS_MAX_CONCURRENCY = int(os.getenv('METIS_MAX_CONCURRENCY', 4))
+USER_QUOTA_LIMIT = int(os.getenv('USER_QUOTA_LIMIT', 10))
+USER_QUOTA_WINDOW = int(os.getenv('USER_QUOTA_WINDOW', 600))
+# Priority classes in the order they are served. Classes joined with '=' share a rank,
+# e.g. 'first_time=repeat' turns the preference for first-time users off
+PRIORITY_CLASS_NAMES = ("first_time", "repeat")
+PRIORITY_CLASSES = os.getenv('PRIORITY_CLASSES', 'first_time,repeat')
+
+
+def parse_priority_classes(order: str) -> Dict[str, int]:
+    """Map each priority class to its rank, lower is served first."""
+    ranks = [(name.strip(), rank) for rank, group in enumerate(order.split(",")) for name in group.split("=")]
+    if sorted(name for name, _ in ranks) != sorted(PRIORITY_CLASS_NAMES):
+        raise ValueError(f"PRIORITY_CLASSES must rank each of {', '.join(PRIORITY_CLASS_NAMES)} once, got {order!r}")
+    return dict(ranks)
+
+
+_priority_ranks = parse_priority_classes(PRIORITY_CLASSES)
+PRIORITY_FIRST_TIME = _priority_ranks["first_time"]
+PRIORITY_REPEAT = _priority_ranks["repeat"]
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SlidingWindowQuota:
+    """Allow at most ``limit`` events per key within the last ``window`` seconds."""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._events: Dict[int, Deque[float]] = {}
+
+    def try_acquire(self, key: int, now: Optional[float] = None) -> float:
+        """Record an event for ``key``. Returns 0 if allowed, otherwise seconds until a slot frees up."""
+        now = time.monotonic() if now is None else now
+        retry_after = self.retry_after(key, now)
+        if not retry_after:
+            self._events.setdefault(key, deque()).append(now)
+        return retry_after
+
+    def retry_after(self, key: int, now: Optional[float] = None) -> float:
+        """Like ``try_acquire`` without recording an event: 0 if ``key`` is within its quota."""
+        now = time.monotonic() if now is None else now
+        events = self._events.get(key) or deque()
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if len(events) >= self.limit:
+            return events[0] + self.window - now if events else self.window
+        return 0.0
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Forget keys with no events inside the window."""
+        now = time.monotonic() if now is None else now
+        stale = [key for key, events in self._events.items() if not events or events[-1] <= now - self.window]
+        for key in stale:
+            del self._events[key]
+
+
+class FairScheduler:
+    """Admission control in front of the Metis calls.
+
+    At most ``max_concurrency`` calls run at once. Waiting requests are served
+    by strict priority class first, then deficit round-robin across chats
+    inside a class, so one chat sending dozens of photos only gets its turn
+    like everybody else.
+    """
+
+    def __init__(self, max_concurrency: int = METIS_MAX_CONCURRENCY, quantum: int = 1,
+                 quota: Optional[SlidingWindowQuota] = None):
+        self.max_concurrency = max_concurrency
+        self.quantum = quantum
+        self.quota = quota
+        self._in_flight = 0
+        # priority -> chat_id -> waiting (cost, future), in round-robin order
+        self._active: Dict[int, "OrderedDict[int, Deque[Tuple[int, asyncio.Future]]]"] = {}
+        # DRR state per (priority, chat_id)
+        self._deficits: Dict[Tuple[int, int], int] = {}
+        self._has_turn: Set[Tuple[int, int]] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for chats in self._active.values() for queue in chats.values())
+
+    def quota_retry_after(self, user_id: int) -> float:
+        """Seconds until the user may start another analysis, 0 if they may now."""
+        return self.quota.retry_after(user_id) if self.quota is not None else 0.0
+
+    async def acquire(self, chat_id: int, user_id: int, priority: int = PRIORITY_REPEAT, cost: int = 1) -> None:
+        """Wait for this chat's turn. Raises QuotaExceeded when the user is over quota."""
+        if self.quota is not None:
+            retry_after = self.quota.try_acquire(user_id)
+            if retry_after:
+                raise QuotaExceeded(f"User {user_id} exceeded the analysis quota", retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        chats = self._active.setdefault(priority, OrderedDict())
+        chats.setdefault(chat_id, deque()).append((cost, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted right as we got cancelled, hand it back
+                self.release()
+            raise
+
+    def try_occupy(self) -> bool:
+        """Take a free slot right away without queueing, e.g. for a hedged request. False if none is free."""
+        if self._in_flight >= self.max_concurrency:
+            return False
+        self._in_flight += 1
+        return True
+
+    def occupy(self) -> None:
+        """Count a call that keeps running after its slot's owner moved on, even over the limit.
+
+        Requests queue until enough of these are released again.
+        """
+        self._in_flight += 1
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, chat_id: int, user_id: int, priority: int = PRIORITY_REPEAT, cost: int = 1):
+        await self.acquire(chat_id, user_id, priority, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self.max_concurrency:
+            future = self._next()
+            if future is None:
+                return
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _next(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._active):
+            chats = self._active[priority]
+            while chats:
+                chat_id, queue = next(iter(chats.items()))
+                flow = (priority, chat_id)
+                cost, future = queue[0]
+                if future.cancelled():
+                    queue.popleft()
+                    if not queue:
+                        self._retire(chats, flow)
+                    continue
+
+                # A chat receives one quantum each time it reaches the head of the round
+                if flow not in self._has_turn:
+                    self._deficits[flow] = self._deficits.get(flow, 0) + self.quantum
+                    self._has_turn.add(flow)
+
+                if self._deficits[flow] >= cost:
+                    self._deficits[flow] -= cost
+                    queue.popleft()
+                    if not queue:
+                        self._retire(chats, flow)
+                    return future
+
+                # Out of credit: end this chat's turn and move on
+                self._has_turn.discard(flow)
+                chats.move_to_end(chat_id)
+            del self._active[priority]
+        return None
+
+    def _retire(self, chats: "OrderedDict", flow: Tuple[int, int]) -> None:
+        """An emptied chat leaves the round and loses its unused credit."""
+        del chats[flow[1]]
+        self._deficits.pop(flow, None)
+        self._has_turn.discard(flow)
+
+
+def build_scheduler(max_concurrency: int = METIS_MAX_CONCURRENCY) -> FairScheduler:
+    """The bot's scheduler, with the configured per-user quota."""
+    return FairScheduler(max_concurrency, quota=SlidingWindowQuota(USER_QUOTA_LIMIT, USER_QUOTA_WINDOW))
+
+
+async def prune_quotas(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback: forget users whose quota window has passed. The job's data is the scheduler."""
+    scheduler = context.job.data
+    if scheduler.quota is not None:
+        scheduler.quota.prune()
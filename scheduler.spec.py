@@ -0,0 +1,127 @@
+import asyncio
+from typing import List
+
+from scheduler import (FairScheduler, PRIORITY_FIRST_TIME, PRIORITY_REPEAT, QuotaExceeded, SlidingWindowQuota,
+                       parse_priority_classes)
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def serve(scheduler: FairScheduler, requests: List[tuple]) -> List[str]:
+    """Queue ``(label, chat_id, priority)`` requests behind a busy slot and return the order they are granted."""
+    granted = []
+
+    async def request(label: str, chat_id: int, priority: int) -> None:
+        await scheduler.acquire(chat_id, chat_id, priority)
+        granted.append(label)
+
+    await scheduler.acquire(0, 0)  # Occupies the only slot while everything queues
+    tasks = [asyncio.create_task(request(*item)) for item in requests]
+    await settle()
+    assert granted == [] and scheduler.waiting == len(requests)
+    for _ in requests:
+        scheduler.release()
+        await settle()
+    await asyncio.gather(*tasks)
+    scheduler.release()
+    assert scheduler.in_flight == 0 and scheduler.waiting == 0
+    return granted
+
+
+async def check_round_robin() -> None:
+    # A chat sending a burst gets one turn per round, like everybody else
+    order = await serve(FairScheduler(max_concurrency=1), [
+        ("a1", 1, PRIORITY_REPEAT), ("a2", 1, PRIORITY_REPEAT), ("a3", 1, PRIORITY_REPEAT),
+        ("b1", 2, PRIORITY_REPEAT), ("c1", 3, PRIORITY_REPEAT),
+    ])
+    assert order == ["a1", "b1", "c1", "a2", "a3"], order
+
+
+async def check_priority() -> None:
+    # First-time users go first even when they queued last
+    order = await serve(FairScheduler(max_concurrency=1), [
+        ("a1", 1, PRIORITY_REPEAT), ("a2", 1, PRIORITY_REPEAT),
+        ("b1", 2, PRIORITY_FIRST_TIME), ("c1", 3, PRIORITY_FIRST_TIME),
+    ])
+    assert order == ["b1", "c1", "a1", "a2"], order
+
+
+def check_priority_classes() -> None:
+    assert parse_priority_classes("first_time,repeat") == {"first_time": 0, "repeat": 1}
+    assert parse_priority_classes("repeat, first_time") == {"repeat": 0, "first_time": 1}
+    assert parse_priority_classes("first_time=repeat") == {"first_time": 0, "repeat": 0}
+    for order in ("first_time", "first_time,repeat,first_time", "first_time,vip"):
+        try:
+            parse_priority_classes(order)
+        except ValueError:
+            continue
+        raise AssertionError(f"{order!r} should be rejected")
+
+
+async def check_cancellation() -> None:
+    scheduler = FairScheduler(max_concurrency=1)
+    await scheduler.acquire(0, 0)
+    cancelled = asyncio.create_task(scheduler.acquire(1, 1))
+    waiting = asyncio.create_task(scheduler.acquire(2, 2))
+    await settle()
+    cancelled.cancel()
+    await settle()
+    # The cancelled request is skipped and never holds the slot
+    scheduler.release()
+    await settle()
+    assert cancelled.cancelled() and waiting.done() and scheduler.in_flight == 1
+    scheduler.release()
+    assert scheduler.in_flight == 0 and scheduler.waiting == 0
+
+    # Cancelled right after being granted: the slot is handed back
+    await scheduler.acquire(0, 0)
+    late = asyncio.create_task(scheduler.acquire(3, 3))
+    await settle()
+    scheduler.release()  # Grants the slot to ``late``...
+    late.cancel()  # ...which is cancelled before it could resume
+    await settle()
+    assert late.cancelled() and scheduler.in_flight == 0
+
+
+async def check_quota() -> None:
+    scheduler = FairScheduler(max_concurrency=4, quota=SlidingWindowQuota(limit=2, window=60))
+    for _ in range(2):
+        async with scheduler.slot(1, 42):
+            pass
+    try:
+        await scheduler.acquire(1, 42)
+    except QuotaExceeded as e:
+        assert 0 < e.retry_after <= 60
+    else:
+        raise AssertionError("the third request should exceed the quota")
+    assert scheduler.in_flight == 0
+    # Quotas are per user, not per chat
+    async with scheduler.slot(1, 43):
+        pass
+
+    quota = SlidingWindowQuota(limit=1, window=10)
+    # Checking does not use up the quota
+    assert quota.retry_after(7, now=100) == 0 and quota.retry_after(7, now=100) == 0
+    assert quota.try_acquire(7, now=100) == 0
+    assert quota.retry_after(7, now=104) == 6
+    assert quota.try_acquire(7, now=105) == 5
+    assert quota.try_acquire(7, now=110) == 0
+    quota.prune(now=200)
+    assert not quota._events
+
+
+async def main() -> None:
+    await check_round_robin()
+    await check_priority()
+    check_priority_classes()
+    await check_cancellation()
+    await check_quota()
+
+
+# Usage: python scheduler.spec.py
+if __name__ == "__main__":
+    asyncio.run(main())
+    print("scheduler: all checks passed")
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Sessions untouched for this long are dropped (the user picks a city again)
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 7 * 24 * 3600))
+SESSION_EVICTION_INTERVAL = int(os.getenv('SESSION_EVICTION_INTERVAL', 3600))
+# A photo whose indoor/outdoor question is not answered within this time is dropped
+PENDING_PHOTO_TTL = int(os.getenv('PENDING_PHOTO_TTL', 900))
+
+
+class PendingUpload:
+    """Speculative Metis upload of a photo flow: one call per photo, plus the session opened alongside.
+
+    Holds the executor futures themselves, so discarding it can cancel the
+    calls still waiting for a thread and clean up once the running ones end.
+    """
+    __slots__ = ("uploads", "session")
+
+    def __init__(self, uploads: List[Future], session: Optional[Future] = None):
+        self.uploads = uploads
+        self.session = session
+
+    def _calls(self) -> List[Future]:
+        return self.uploads + ([self.session] if self.session is not None else [])
+
+    def _wait(self) -> asyncio.Future:
+        return asyncio.gather(*(asyncio.wrap_future(call) for call in self._calls()), return_exceptions=True)
+
+    async def result(self) -> Tuple[List[str], str]:
+        """Wait for every call and return the URLs of the photos that uploaded and the session ID, if any."""
+        await self._wait()
+        uploaded_paths, session_id = self._collect()
+        if len(self.uploads) > 1 and len(uploaded_paths) < len(self.uploads):
+            logger.warning("%d of %d album photos failed to upload", len(self.uploads) - len(uploaded_paths),
+                           len(self.uploads))
+        return uploaded_paths, session_id
+
+    def discard(self, clean_up: Callable[[Tuple[List[str], str]], None]) -> None:
+        """Cancel the calls that have not started and hand what the others produce to ``clean_up``."""
+        for call in self._calls():
+            call.cancel()  # Only works for calls still queued, a running request cannot be interrupted
+        self._wait().add_done_callback(lambda _: clean_up(self._collect()))
+
+    def _collect(self) -> Tuple[List[str], str]:
+        def value(call: Future) -> str:
+            if call.cancelled():
+                return ""
+            if call.exception() is not None:
+                logger.error("Metis call failed: %s", call.exception())
+                return ""
+            return call.result()
+
+        uploaded_paths = [uploaded_path for uploaded_path in map(value, self.uploads) if uploaded_path]
+        return uploaded_paths, value(self.session) if self.session is not None else ""
+
+
+class UserSession:
+    """Per-user conversation state.
+
+    Uses ``__slots__`` instead of a per-user dict, stores the photo paths as
+    plain strings and interns city/environment so every user shares the same
+    few string objects.
+    """
+    __slots__ = ("selected_city", "environment", "uploaded_file_paths", "pending_upload", "correlation_id",
+                 "analysis_count", "last_seen")
+
+    def __init__(self):
+        self.selected_city: Optional[str] = None
+        self.environment: Optional[str] = None
+        # One photo, or every photo of an album
+        self.uploaded_file_paths: Optional[Tuple[str, ...]] = None
+        # Speculative Metis upload started as soon as the photo arrived
+        self.pending_upload: Optional[PendingUpload] = None
+        # Log correlation ID of the photo flow in progress
+        self.correlation_id: Optional[str] = None
+        self.analysis_count: int = 0
+        self.last_seen: int = 0
+
+    def set_city(self, city: str) -> None:
+        self.selected_city = sys.intern(city)
+
+    def set_environment(self, environment: str) -> None:
+        self.environment = sys.intern(environment)
+
+    def set_uploaded_files(self, file_paths: Sequence[Path], pending_upload: Optional[PendingUpload] = None) -> None:
+        self.uploaded_file_paths = tuple(str(file_path) for file_path in file_paths) or None
+        self.pending_upload = pending_upload
+
+    def pop_uploaded_files(self) -> Tuple[List[Path], Optional[PendingUpload]]:
+        """Take the pending photos and their upload out of the session."""
+        file_paths, self.uploaded_file_paths = self.uploaded_file_paths or (), None
+        pending_upload, self.pending_upload = self.pending_upload, None
+        return [Path(file_path) for file_path in file_paths], pending_upload
+
+    def discard_uploaded_files(self, release: Optional[Callable[[Any], None]] = None) -> None:
+        """Drop unanswered photos, see ``discard_upload``."""
+        discard_upload(*self.pop_uploaded_files(), release)
+
+
+def discard_upload(file_paths: Sequence[Path], pending_upload: Optional[PendingUpload],
+                   release: Optional[Callable[[Any], None]] = None) -> None:
+    """Drop photos nobody waits for anymore.
+
+    Upload calls that have not started are cancelled. Running ones cannot be
+    interrupted and may still be reading the files, so only once they end is
+    what they produced handed to ``release`` (to free what they created
+    remotely) and are the files deleted.
+    """
+    def clean_up(prepared: Optional[Tuple[List[str], str]] = None) -> None:
+        if prepared is not None and release is not None:
+            release(prepared)
+        for file_path in file_paths:
+            file_path.unlink(missing_ok=True)
+
+    if pending_upload is None:
+        clean_up()
+    else:
+        pending_upload.discard(clean_up)
+
+
+class SessionStore:
+    def __init__(self, idle_ttl: int = SESSION_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[int, UserSession] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, user_id: int) -> UserSession:
+        """Return the user's session, creating it if needed, and mark it as active."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = self._sessions[user_id] = UserSession()
+        session.last_seen = int(time.monotonic())
+        return session
+
+    def peek(self, user_id: int) -> Optional[UserSession]:
+        """Return the user's session without creating or touching it."""
+        return self._sessions.get(user_id)
+
+    def evict_idle(self, now: Optional[float] = None) -> List[UserSession]:
+        """Drop sessions idle for longer than ``idle_ttl`` and return them."""
+        deadline = int(now if now is not None else time.monotonic()) - self.idle_ttl
+        idle_users = [user_id for user_id, session in self._sessions.items() if session.last_seen < deadline]
+        return [self._sessions.pop(user_id) for user_id in idle_users]
+
+
+sessions = SessionStore()
+
+
+async def evict_idle_sessions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback: evict idle sessions and remove their leftover photos.
+
+    The job's data is the ``release`` callback for their uploads, see ``discard_upload``.
+    """
+    evicted = sessions.evict_idle()
+    for session in evicted:
+        session.discard_uploaded_files(context.job.data)
+    if evicted:
+        logger.info("Evicted %d idle sessions, %d active", len(evicted), len(sessions))
+
+
+def _pending_photo_job_name(user_id: int) -> str:
+    return f"pending_photo:{user_id}"
+
+
+async def expire_pending_photo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback: the user never answered the indoor/outdoor question."""
+    session = sessions.peek(context.job.user_id)
+    if session is not None and session.uploaded_file_paths:
+        logger.info("Discarding unanswered photo of user %s", context.job.user_id)
+        session.discard_uploaded_files(context.job.data)
+
+
+def schedule_pending_photo_expiry(context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                                  release: Optional[Callable[[Any], None]] = None) -> None:
+    """Discard the user's photo if still unanswered after PENDING_PHOTO_TTL, handing its upload to ``release``."""
+    cancel_pending_photo_expiry(context, user_id)
+    context.job_queue.run_once(expire_pending_photo, PENDING_PHOTO_TTL, user_id=user_id,
+                               name=_pending_photo_job_name(user_id), data=release)
+
+
+def cancel_pending_photo_expiry(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    for job in context.job_queue.get_jobs_by_name(_pending_photo_job_name(user_id)):
+        job.schedule_removal()
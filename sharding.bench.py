@@ -0,0 +1,83 @@
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from sharding import ShardPool
+
+UPDATES = 2000
+CHATS = 500
+WORKER_COUNTS = [1, 2, 4, 8]
+# CPU time spent per update besides JSON, roughly image preprocessing and reply building
+CPU_WORK_ITERATIONS = 40_000
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1730000000,
+            "chat": {"id": chat_id, "type": "private", "first_name": "کاربر"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "کاربر"},
+            "media_group_id": None,
+            "photo": [{"file_id": f"AgACAgQAAxkBAAI{update_id:012d}", "file_unique_id": "AQADx", "width": w,
+                       "height": w * 3 // 4, "file_size": w * 100} for w in (90, 320, 800, 1280)],
+        },
+    }
+
+
+def cpu_worker(shard: int, queue, results) -> None:
+    """Stand-in for a bot worker: parse the update, do CPU work, serialize a reply."""
+    handled = 0
+    last_seen = {}
+    results.put("ready")
+    while True:
+        payload = queue.get()
+        if payload is None:
+            break
+        update = json.loads(payload)
+        chat_id = update["message"]["chat"]["id"]
+        # Per-chat order must be preserved inside a shard
+        assert last_seen.get(chat_id, -1) < update["update_id"]
+        last_seen[chat_id] = update["update_id"]
+        acc = 0
+        for i in range(CPU_WORK_ITERATIONS):
+            acc = (acc + i * i) % 1_000_003
+        json.dumps({"chat_id": chat_id, "text": "🪴" * 200, "checksum": acc})
+        handled += 1
+    results.put(handled)
+
+
+def run(workers: int, updates: list) -> float:
+    results = multiprocessing.get_context("spawn").Queue()
+    pool = ShardPool(workers, cpu_worker, (results,))
+    pool.start()
+    # Exclude process start-up from the measurement
+    for _ in range(workers):
+        results.get()
+    start = time.perf_counter()
+    for chat_id, payload in updates:
+        pool.route(chat_id, payload)
+    pool.stop()
+    elapsed = time.perf_counter() - start
+    handled = sum(results.get() for _ in range(workers))
+    assert handled == len(updates), (handled, len(updates))
+    return len(updates) / elapsed
+
+
+# Usage: python sharding.bench.py
+if __name__ == "__main__":
+    rng = random.Random(0)
+    updates = []
+    for update_id in range(UPDATES):
+        chat_id = rng.randrange(1, CHATS + 1) * 7919
+        updates.append((chat_id, json.dumps(make_update(update_id, chat_id))))
+
+    print(f"{UPDATES} updates from {CHATS} chats, {os.cpu_count()} CPUs")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        throughput = run(workers, updates)
+        baseline = baseline or throughput
+        print(f"{workers} worker(s): {throughput:8.0f} updates/s  ({throughput / baseline:.2f}x)")
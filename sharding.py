@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Any, Callable
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from bot_transport import configure_requests
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for workers to drain their queues on shutdown
+WORKER_SHUTDOWN_TIMEOUT = 30
+WORKER_HEALTH_CHECK_INTERVAL = 5
+
+
+def shard_for(key: int, shards: int) -> int:
+    """Shard index of a key. Every update with the same key lands on the same worker."""
+    return key % shards
+
+
+def update_shard_key(update: Update) -> int:
+    """Shard by user, like sessions and quotas are keyed, so a user's state lives in one worker
+    even when they move between a private chat and a group."""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return 0
+
+
+class ShardPool:
+    """N worker processes, each fed by its own FIFO queue.
+
+    ``target(shard, queue, *args)`` runs in each worker and must return once it
+    reads ``None`` from its queue.
+    """
+
+    def __init__(self, workers: int, target: Callable, args: tuple = ()):
+        context = multiprocessing.get_context("spawn")
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.processes = [
+            context.Process(target=target, args=(shard, queue, *args), name=f"shard-{shard}")
+            for shard, queue in enumerate(self.queues)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    def route(self, key: int, item: Any) -> None:
+        self.queues[shard_for(key, len(self.queues))].put(item)
+
+    def all_alive(self) -> bool:
+        return all(process.is_alive() for process in self.processes)
+
+    def stop(self, timeout: float = WORKER_SHUTDOWN_TIMEOUT) -> None:
+        """Ask every worker to finish its queue and exit, then reap them."""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating it", process.name)
+                process.terminate()
+                process.join()
+
+
+def run_worker(shard: int, update_queue, app_factory: Callable[[], Application]) -> None:
+    """Entry point of a worker process: run a full bot without its own polling."""
+    # Ctrl+C reaches the whole process group, the supervisor decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(static_fields={"shard": shard})
+    asyncio.run(_worker_loop(shard, update_queue, app_factory))
+
+
+async def _worker_loop(shard: int, update_queue, app_factory: Callable[[], Application]) -> None:
+    app = app_factory()
+    loop = asyncio.get_running_loop()
+    async with app:
+        # run_polling would call these hooks, here it is up to us
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        logger.info("Worker %d ready", shard)
+        # Updates are queued in arrival order, but the application handles them concurrently
+        # (concurrent_updates) just like the single-process bot, so their order is not preserved
+        while True:
+            data = await loop.run_in_executor(None, update_queue.get)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+        await app.stop()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    logger.info("Worker %d stopped", shard)
+
+
+def run_supervisor(token: str, workers: int, app_factory: Callable[[], Application]) -> None:
+    """Poll Telegram in this process and hand every update to the worker owning its user.
+
+    Conversation state lives in the workers, so a user's state always stays in
+    one process. Each worker runs its own scheduler, so process-wide limits
+    must be split between them. ``app_factory`` must be a module-level
+    function (it is pickled for the spawned workers) returning an Application
+    built with ``updater(None)``.
+    """
+    pool = ShardPool(workers, run_worker, (app_factory,))
+
+    async def forward_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        pool.route(update_shard_key(update), update.to_dict())
+
+    async def check_workers(context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not pool.all_alive():
+            logger.critical("A worker process died, shutting down")
+            context.application.stop_running()
+
+    async def stop_workers(application: Application) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, pool.stop)
+
+    # The supervisor only polls and forwards, the workers keep their own outbound pools
+    app = (configure_requests(Application.builder().token(token))
+           .post_shutdown(stop_workers)
+           .build())
+    app.add_handler(TypeHandler(Update, forward_update))
+    app.job_queue.run_repeating(check_workers, interval=WORKER_HEALTH_CHECK_INTERVAL)
+
+    pool.start()
+    logger.info("Supervisor started %d workers", len(pool))
+    try:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        # run_polling already stopped them unless it failed to start
+        if any(process.is_alive() for process in pool.processes):
+            pool.stop()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+from telegram import Bot
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+import bot_transport
+from bot_transport import InstrumentedTransport, PoolStats, create_request
+
+REPLIES = 100
+# Calls per reply: delete the waiting message, two plant cards, the "ready" message
+CALLS_PER_REPLY = 4
+# Round trip of one Bot API call, and the extra cost of a new connection (TLS handshake)
+API_LATENCY = 0.05
+CONNECT_COST = 0.15
+TOKEN = "123456:bench"
+
+
+async def mock_bot_api(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """A keep-alive HTTP/1.1 server answering every Bot API method with ``true``."""
+    mock_bot_api.connections += 1
+    try:
+        await asyncio.sleep(CONNECT_COST)
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode().split("\r\n")
+            headers = dict(line.lower().split(": ", 1) for line in header_lines if ": " in line)
+            await reader.readexactly(int(headers.get("content-length", 0)))
+            await asyncio.sleep(API_LATENCY)
+            if request_line.split()[1].endswith("/getMe"):
+                result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            else:
+                result = True
+            body = json.dumps({"ok": True, "result": result}).encode()
+            keep_alive = headers.get("connection") != "close"
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\nConnection: %s\r\n\r\n%s"
+                         % (len(body), b"keep-alive" if keep_alive else b"close", body))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def reply(bot: Bot) -> None:
+    for _ in range(CALLS_PER_REPLY):
+        await bot.delete_message(chat_id=1, message_id=1)
+
+
+async def measure(label: str, port: int, request: HTTPXRequest, stats: PoolStats) -> None:
+    mock_bot_api.connections = 0
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{port}/bot", request=request)
+    async with bot:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(reply(bot) for _ in range(REPLIES)), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+    timed_out = sum(isinstance(result, TimedOut) for result in results)
+    metrics = stats.snapshot()
+    print(f"{label:<30} {REPLIES * CALLS_PER_REPLY / elapsed:7.0f} calls/s  timed out {timed_out:3d}/{REPLIES}  "
+          f"connections {mock_bot_api.connections:3d}  pool wait p99 {metrics['pool_wait_p99_ms']:7.1f} ms")
+
+
+def default_request(stats: PoolStats, pool_size: int, keepalive: bool) -> HTTPXRequest:
+    """python-telegram-bot's own settings (1 s pool timeout), instrumented the same way."""
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size if keepalive else 0)
+    return HTTPXRequest(connection_pool_size=pool_size,
+                        httpx_kwargs={"transport": InstrumentedTransport(stats, limits=limits)})
+
+
+async def main() -> None:
+    server = await asyncio.start_server(mock_bot_api, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        stats = PoolStats("bot default")
+        await measure("Bot() default, pool 1", port, default_request(stats, 1, keepalive=True), stats)
+        stats = PoolStats("no keep-alive")
+        await measure("pool 32, no keep-alive", port, default_request(stats, 32, keepalive=False), stats)
+        stats = PoolStats("builder default")
+        await measure("builder default, pool 256", port, default_request(stats, 256, keepalive=True), stats)
+        await measure("tuned (bot_transport)", port,
+                      create_request("bench", bot_transport.BOT_API_POOL_SIZE, bot_transport.BOT_API_READ_TIMEOUT,
+                                     http2=False),
+                      bot_transport.pool_stats["bench"])
+
+
+# Usage: python transport.bench.py
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main())